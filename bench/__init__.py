@@ -0,0 +1,8 @@
+"""
+Load generator and benchmarks for the Flask server.
+
+    python -m bench.run --database-url sqlite:///bench.db --gateways 50 --esp32 20 --duration 600
+    python -m bench.compare baseline.json candidate.json
+
+See README.md ("Benchmarks") for what is measured.
+"""
@@ -0,0 +1,63 @@
+"""
+Compares two bench.run result files and flags regressions.
+
+    python -m bench.compare baseline.json candidate.json --threshold 0.2
+
+Latencies, durations, memory and query counts are "lower is better";
+throughput figures are "higher is better". Exits with status 1 if any
+metric got worse by more than the threshold.
+"""
+import argparse
+import json
+import sys
+
+HIGHER_IS_BETTER = ('rows_per_second', 'headroom')
+LOWER_IS_BETTER = ('_ms', 'ms', 'seconds', 'peak_rss_mb', 'rss_growth_mb', 'queries', 'queries_per_request', 'lag_ms_per_fleet_second')
+
+
+def flatten(results, prefix=''):
+    for key, value in results.items():
+        path = f"{prefix}{key}"
+        if isinstance(value, dict):
+            yield from flatten(value, path + ' / ')
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            yield path, key, value
+
+
+def direction(key):
+    if key in HIGHER_IS_BETTER:
+        return 1
+    if key in LOWER_IS_BETTER or key.endswith('_ms'):
+        return -1
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('baseline')
+    parser.add_argument('candidate')
+    parser.add_argument('--threshold', type=float, default=0.2, help='Relative change that counts as a regression')
+    args = parser.parse_args(argv)
+
+    with open(args.baseline) as f:
+        baseline = dict((path, value) for path, _, value in flatten({k: v for k, v in json.load(f).items() if k != 'meta'}))
+    with open(args.candidate) as f:
+        candidate = list(flatten({k: v for k, v in json.load(f).items() if k != 'meta'}))
+
+    regressions = 0
+    for path, key, value in candidate:
+        sign = direction(key)
+        old = baseline.get(path)
+        if not sign or old in (None, 0):
+            continue
+        change = (value - old) / abs(old)
+        worse = change * sign < -args.threshold
+        regressions += worse
+        marker = 'REGRESSION' if worse else ('improved' if change * sign > args.threshold else '')
+        print(f"{path:<60} {old:>12} -> {value:>12}  {change:+7.1%}  {marker}")
+
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == '__main__':
+    main()
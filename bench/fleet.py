@@ -0,0 +1,88 @@
+"""
+Synthetic fleet: NanoPi gateways and ESP32 nodes producing 'readings' rows
+shaped like the ones the real devices end up writing.
+
+  - Gateways report MCP9808 temperatures on mux channels and GPIO levels
+    (gpio3 reports 9 pins; the server keeps the first 8).
+  - ESP32 nodes report temperature and humidity pairs and 8 GPIO inputs.
+
+Every GPIO pin follows an on/off process with exponentially distributed
+idle and alarm durations, so the alarm processor sees realistic edges.
+"""
+import datetime
+
+import numpy as np
+
+READING_VALUE_COLUMNS = [f'temp{i}' for i in range(8)] + [f'hum{i}' for i in range(8)] + [f'gpio{i}' for i in range(8)]
+
+
+class Device:
+    def __init__(self, client_id, kind, temp_channels, hum_channels, rng):
+        self.client_id = client_id
+        self.kind = kind
+        self.temp_channels = temp_channels
+        self.hum_channels = hum_channels
+        self.temp_base = rng.uniform(18, 26, size=8)
+        self.hum_base = rng.uniform(35, 60, size=8)
+
+
+def build_fleet(gateways, esp32_nodes, seed=0):
+    rng = np.random.default_rng(seed)
+    devices = []
+    for index in range(gateways):
+        channels = sorted(rng.choice(8, size=int(rng.integers(1, 9)), replace=False).tolist())
+        devices.append(Device(f"gw-{index:04d}", 'gateway', channels, [], rng))
+    for index in range(esp32_nodes):
+        channels = list(range(int(rng.integers(1, 5))))
+        devices.append(Device(f"esp-{index:04d}", 'esp32', channels, channels, rng))
+    return devices
+
+
+def _gpio_levels(rng, samples, rate_hz, mean_idle_seconds, mean_alarm_seconds):
+    """One pin's 0/1 levels: alternating runs with exponentially distributed lengths."""
+    levels = np.empty(samples, dtype=np.int8)
+    position, level = 0, 0
+    while position < samples:
+        mean = mean_alarm_seconds if level else mean_idle_seconds
+        run = max(1, int(rng.exponential(mean) * rate_hz))
+        levels[position:position + run] = level
+        position += run
+        level ^= 1
+    return levels
+
+
+def generate_readings(devices, rate_hz, duration_seconds, start_time=None, seed=0,
+                      mean_idle_seconds=120.0, mean_alarm_seconds=20.0, chunk_seconds=60):
+    """
+    Yields lists of 'readings' row dicts, interleaved across devices in time
+    order, one chunk of 'chunk_seconds' at a time so memory stays bounded.
+    """
+    rng = np.random.default_rng(seed)
+    if start_time is None:
+        start_time = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(seconds=duration_seconds)
+    samples = int(duration_seconds * rate_hz)
+    per_chunk = max(1, int(chunk_seconds * rate_hz))
+
+    series = []
+    for device in devices:
+        temps = device.temp_base[:, None] + np.cumsum(rng.normal(0, 0.01, size=(8, samples)), axis=1)
+        hums = device.hum_base[:, None] + np.cumsum(rng.normal(0, 0.02, size=(8, samples)), axis=1)
+        gpios = np.stack([_gpio_levels(rng, samples, rate_hz, mean_idle_seconds, mean_alarm_seconds) for _ in range(8)])
+        offset = rng.uniform(0, 1.0 / rate_hz)
+        series.append((device, np.round(temps, 2), np.round(hums, 2), gpios, offset))
+
+    for chunk_start in range(0, samples, per_chunk):
+        chunk_end = min(samples, chunk_start + per_chunk)
+        rows = []
+        for sample in range(chunk_start, chunk_end):
+            for device, temps, hums, gpios, offset in series:
+                row = {
+                    "client_id": device.client_id,
+                    "created_at": start_time + datetime.timedelta(seconds=sample / rate_hz + offset)
+                }
+                for channel in range(8):
+                    row[f'temp{channel}'] = float(temps[channel, sample]) if channel in device.temp_channels else None
+                    row[f'hum{channel}'] = float(hums[channel, sample]) if channel in device.hum_channels else None
+                    row[f'gpio{channel}'] = int(gpios[channel, sample])
+                rows.append(row)
+        yield rows
@@ -0,0 +1,49 @@
+"""
+Stand-in for the gpio3 executable, for running the gateway without GPIO
+hardware. Emits the same protocol: a full-state 'S' line at startup and
+every second, and an 'E' line for every simulated transition.
+
+    GPIO_EXECUTABLE="python3 fake_gpio.py" GPIO_USE_SUDO=0 python3 nanopi_client.py
+"""
+import argparse
+import random
+import sys
+import time
+
+HEARTBEAT_SECONDS = 1.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--pins', default='0,2,3,7,12,13,14,15,16', help='Comma-separated pin numbers to report')
+    parser.add_argument('--edges-per-second', type=float, default=0.5, help='Average rate of simulated transitions')
+    parser.add_argument('--seed', type=int, default=None)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    pins = [int(pin) for pin in args.pins.split(',')]
+    levels = {pin: 1 for pin in pins} # Pull-ups: idle inputs read HIGH
+
+    def print_state(now_ns):
+        sys.stdout.write(f"S {now_ns} " + " ".join(f"{pin}={levels[pin]}" for pin in pins) + "\n")
+
+    last_heartbeat = time.monotonic_ns()
+    print_state(last_heartbeat)
+    sys.stdout.flush()
+
+    while True:
+        delay = rng.expovariate(args.edges_per_second) if args.edges_per_second > 0 else HEARTBEAT_SECONDS
+        time.sleep(min(delay, HEARTBEAT_SECONDS))
+        now = time.monotonic_ns()
+        if delay <= HEARTBEAT_SECONDS:
+            pin = rng.choice(pins)
+            levels[pin] ^= 1
+            sys.stdout.write(f"E {now} {pin} {levels[pin]}\n")
+        if now - last_heartbeat >= HEARTBEAT_SECONDS * 1e9:
+            print_state(now)
+            last_heartbeat = now
+        sys.stdout.flush()
+
+
+if __name__ == "__main__":
+    main()
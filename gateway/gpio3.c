@@ -1,32 +1,72 @@
 #include <wiringPi.h>
 #include <stdio.h>
 #include <stdlib.h>
+#include <time.h>
+
+// Output protocol, one record per line:
+//   S <t_ns> <pin>=<level> <pin>=<level> ...   full state, at startup and every HEARTBEAT_NS
+//   E <t_ns> <pin> <level>                     one pin changed level
+// <t_ns> is CLOCK_MONOTONIC in nanoseconds, the clock behind Python's time.monotonic(),
+// so the gateway can turn it into wall-clock time without a second time source.
+#define POLL_US 1000
+#define HEARTBEAT_NS 1000000000LL
 
 // Matches the channels your Python script expects
 int valid_channels[] = {0, 2, 3, 7, 12, 13, 14, 15, 16};
 int num_valid_channels = sizeof(valid_channels) / sizeof(valid_channels[0]);
 
+static long long monotonic_ns(void) {
+    struct timespec ts;
+    clock_gettime(CLOCK_MONOTONIC, &ts);
+    return (long long)ts.tv_sec * 1000000000LL + ts.tv_nsec;
+}
+
+static void print_state(long long now, const int *levels) {
+    printf("S %lld", now);
+    for (int i = 0; i < num_valid_channels; i++) {
+        printf(" %d=%d", valid_channels[i], levels[i]);
+    }
+    printf("\n");
+}
+
 int main() {
     if (wiringPiSetup() == -1) {
         return 1;
     }
 
     // Initialize Pins with Pull-Ups
+    int *levels = malloc(sizeof(int) * num_valid_channels);
     for (int i = 0; i < num_valid_channels; i++) {
         int pin = valid_channels[i];
         pinMode(pin, INPUT);
         pullUpDnControl(pin, PUD_UP);
+        levels[i] = digitalRead(pin);
     }
 
+    long long last_heartbeat = monotonic_ns();
+    print_state(last_heartbeat, levels);
+    fflush(stdout);
+
     while (1) {
+        long long now = monotonic_ns();
+        int dirty = 0;
         for (int i = 0; i < num_valid_channels; i++) {
             int value = digitalRead(valid_channels[i]);
-            // Print only the values separated by commas for Python to read
-            printf("%d%s", value, (i == num_valid_channels - 1) ? "" : ",");
+            if (value != levels[i]) {
+                levels[i] = value;
+                printf("E %lld %d %d\n", now, valid_channels[i], value);
+                dirty = 1;
+            }
+        }
+        if (now - last_heartbeat >= HEARTBEAT_NS) {
+            print_state(now, levels);
+            last_heartbeat = now;
+            dirty = 1;
+        }
+        if (dirty) {
+            fflush(stdout);
         }
-        printf("\n"); // New line for each reading
-        fflush(stdout);
-        delay(100);  
+        delayMicroseconds(POLL_US);
     }
     return 0;
-}
\ No newline at end of file
+}
@@ -1,13 +1,15 @@
+import asyncio
 import subprocess
-import re
+import shlex
 import smbus2
 import time
 import requests
 import json
+import struct
+import math
 import threading
-import queue
 import socket
-import sys
+import os
 
 # ========= CONFIGURATION =========
 # You will only need to edit the variables in this section.
@@ -21,24 +23,81 @@ CLIENT_ID = "pi-lab"
 
 # The path to the compiled C program that reads GPIO states.
 # Ensure this file is in the same directory and is executable (`chmod +x gpio3`).
-GPIO_EXECUTABLE = "./gpio3"
+# Both can be overridden from the environment, e.g. to run against fake_gpio.py:
+#   GPIO_EXECUTABLE="python3 fake_gpio.py" GPIO_USE_SUDO=0 python3 nanopi_client.py
+GPIO_EXECUTABLE = os.environ.get("GPIO_EXECUTABLE", "./gpio3")
+GPIO_USE_SUDO = os.environ.get("GPIO_USE_SUDO", "1") != "0"
 
-# How often (in seconds) the client sends data to the server.
-SEND_INTERVAL = 0.1
+# How often (in seconds) the client samples its sensors. Samples are spooled to
+# disk and uploaded in batches, so nothing is lost while the server is unreachable.
+SAMPLE_INTERVAL = 0.1
+
+# --- Pipeline Configuration ---
+# The gateway runs as independent stages (GPIO reader, sensor sampler, batcher,
+# uploader) joined by bounded queues, each on its own schedule.
+SAMPLE_QUEUE_SIZE = 1000               # Samples waiting for the batcher; the oldest is dropped when full
+BATCH_INTERVAL = 0.5                   # How often the batcher writes queued samples to the spool
+UPLOAD_INTERVAL = 0.5                  # How often the uploader checks the spool when it has caught up
+GPIO_RESTART_DELAY = 2                 # Seconds before restarting gpio3 after it exits
+LOG_INTERVAL = 10                      # Seconds between status lines; repeated errors are also limited to one per interval
+
+# --- Store-and-Forward Spool Configuration ---
+SPOOL_DIRECTORY = "spool"              # Created next to this script if it does not exist
+SPOOL_SEGMENT_BYTES = 1024 * 1024      # Size of one spool segment file
+SPOOL_MAX_BYTES = 256 * 1024 * 1024    # Oldest segments are dropped beyond this (roughly a day at 10 Hz)
+UPLOAD_BATCH_SIZE = 500                # Most samples sent in one request
+UPLOAD_TIMEOUT = 10
+UPLOAD_BACKOFF_INITIAL = 0.1           # Seconds; doubled after every failed attempt...
+UPLOAD_BACKOFF_MAX = 60                # ...up to this
+MAX_PENDING_GPIO_EDGES = 1000          # Edges buffered between two sampling cycles before the oldest are dropped
+
+# --- Wire Format ---
+# "binary" sends compact struct-packed batches (about a tenth of the JSON size);
+# the uploader falls back to "json" by itself if the server does not accept them.
+WIRE_FORMAT = "binary"
 
 # --- Server Discovery Configuration ---
 BROADCAST_PORT = 9999
-BROADCAST_MESSAGE = b'IOT_SERVER_DISCOVERY'
+BROADCAST_MESSAGE = b'IOT_SERVER_DISCOVERY/2'
 SERVER_UPDATE_ENDPOINT = "/update"
+SERVER_HEALTH_ENDPOINT = "/health"
+SERVER_CACHE_FILE = "server.json"      # Last server found, tried first after a restart or a dropped connection
+HEALTH_PROBE_TIMEOUT = 0.5
+KNOWN_SERVER_PROBE_INTERVAL = 1        # While backed off after losing the server, how often it is health-probed
+DISCOVERY_TIMEOUT = 1.0
+DEFAULT_SERVER_PORT = 5000             # Used when an older server answers without its port
 
 # --- Advanced Configuration (Usually no changes needed below this line) ---
 TEMPERATURE_SENSOR_ADDRESSES = {
     0x18: "MCP9808" # Only supports MCP9808 temperature sensors
 }
 MUX_ADDRESS_RANGE = range(0x70, 0x78) # Standard I2C MUX addresses
+I2C_SCAN_ADDRESS_RANGE = range(0x03, 0x78) # Same range i2cdetect probes
+TOPOLOGY_RESCAN_INTERVAL = 60 # Seconds between background rescans for hot-plugged devices
+TOPOLOGY_RESCAN_MIN_GAP = TOPOLOGY_RESCAN_INTERVAL / 12 # Failed reads trigger a rescan at most this often
+TOPOLOGY_SCAN_STEP_PAUSE = 0.001 # Between the probes of a rescan, so the sampler can take the bus lock
 
 
 # ========= UTILITIES =========
+class RateLimitedLog:
+    """Prints each kind of message at most once per interval, noting how many were suppressed."""
+    def __init__(self, interval):
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.last = {} # key -> (time printed, messages suppressed since)
+
+    def __call__(self, key, message):
+        now = time.monotonic()
+        with self.lock:
+            printed_at, suppressed = self.last.get(key, (None, 0))
+            if printed_at is not None and now - printed_at < self.interval:
+                self.last[key] = (printed_at, suppressed + 1)
+                return
+            self.last[key] = (now, 0)
+        print(message + (f" ({suppressed} similar messages suppressed)" if suppressed else ""))
+
+log_limited = RateLimitedLog(LOG_INTERVAL)
+
 def get_local_ip():
     """Finds the client's local IP address to send to the server."""
     s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
@@ -52,50 +111,94 @@ def get_local_ip():
         s.close()
     return IP
 
-def find_server():
+def _server_cache_path():
+    return os.path.join(os.path.dirname(os.path.abspath(__file__)), SERVER_CACHE_FILE)
+
+def load_known_server():
+    """Returns the last server found as {'host', 'port', 'instance_id'}, or None."""
+    try:
+        with open(_server_cache_path(), 'r') as f:
+            known = json.load(f)
+        return known if known.get('host') and known.get('port') else None
+    except (OSError, ValueError, AttributeError):
+        return None
+
+def save_known_server(host, port, instance_id):
+    path = _server_cache_path()
+    try:
+        with open(path + '.tmp', 'w') as f:
+            json.dump({"host": host, "port": port, "instance_id": instance_id}, f)
+        os.replace(path + '.tmp', path)
+    except OSError as e:
+        print(f"[DISCOVERY] Could not remember server: {e}")
+
+def probe_known_server(known):
+    """Unicast health check of the remembered server. Returns its instance id, or None if it did not answer."""
+    try:
+        res = requests.get(f"http://{known['host']}:{known['port']}{SERVER_HEALTH_ENDPOINT}", timeout=HEALTH_PROBE_TIMEOUT)
+        if res.status_code == 200:
+            return res.json().get('instance_id') or ''
+    except (requests.RequestException, ValueError):
+        pass
+    return None
+
+def broadcast_discovery():
     """
-    Sends a UDP broadcast message to find the server on the local network.
-    Returns the server's IP and port as a tuple (ip, port).
+    Sends a UDP broadcast and returns (ip, port, instance_id) from the first
+    answer. Servers that only know the old protocol reply b'DISCOVERY_ACK',
+    and are assumed to listen on DEFAULT_SERVER_PORT.
     """
-    print("[DISCOVERY] Searching for server...")
-    server_address = None
     with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
         sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
-        sock.settimeout(3) # Timeout for receiving a response
-        
-        # Send broadcast message
+        sock.settimeout(DISCOVERY_TIMEOUT)
         sock.sendto(BROADCAST_MESSAGE, ('<broadcast>', BROADCAST_PORT))
-        
-        try:
-            # Listen for a response
+        while True:
             data, addr = sock.recvfrom(1024)
             if data == b'DISCOVERY_ACK':
-                server_address = (addr[0], 5000) # Assume default port 5000 from server
-                print(f"[DISCOVERY] Server found at {server_address[0]}")
-                return server_address
-        except socket.timeout:
-            print("[DISCOVERY] Server discovery failed.")
-            return None
-        except Exception as e:
-            print(f"[DISCOVERY] An error occurred: {e}")
-            return None
+                return addr[0], DEFAULT_SERVER_PORT, None
+            try:
+                reply = json.loads(data)
+                if reply.get('ack') == 'DISCOVERY_ACK':
+                    return addr[0], int(reply.get('port', DEFAULT_SERVER_PORT)), reply.get('instance_id')
+            except (ValueError, AttributeError, TypeError):
+                continue # Not a discovery reply; keep listening until the timeout
 
-# ========= I2C HELPERS (Simplified) =========
-def get_i2c_addresses():
-    """Scans the I2C bus and returns a list of detected device addresses."""
+def find_server():
+    """
+    Finds the server: first a health probe to the last server found, which
+    answers in milliseconds when it is up, then a UDP broadcast.
+    Returns the server's IP and port as a tuple (ip, port), or None.
+    """
+    known = load_known_server()
+    if known:
+        instance_id = probe_known_server(known)
+        if instance_id is not None:
+            if instance_id != known.get('instance_id'):
+                print(f"[DISCOVERY] Server at {known['host']}:{known['port']} has restarted")
+                save_known_server(known['host'], known['port'], instance_id)
+            return known['host'], known['port']
+
+    print("[DISCOVERY] Searching for server...")
     try:
-        result = subprocess.run(['i2cdetect', '-y', str(I2C_BUS)], capture_output=True, text=True, check=True)
-        addresses = []
-        for line in result.stdout.splitlines():
-            if re.match(r'^\s*[0-7][0-9a-fA-F]:\s*', line):
-                parts = line.split(':')[1].strip().split()
-                for addr in parts:
-                    if addr != '--':
-                        addresses.append(int(addr, 16))
-        return addresses
+        host, port, instance_id = broadcast_discovery()
+    except socket.timeout:
+        print("[DISCOVERY] Server discovery failed.")
+        return None
     except Exception as e:
-        print(f"[I2C] Detection error: {e}")
-        return []
+        print(f"[DISCOVERY] An error occurred: {e}")
+        return None
+    print(f"[DISCOVERY] Server found at {host}:{port}")
+    save_known_server(host, port, instance_id)
+    return host, port
+
+# ========= I2C HELPERS (Simplified) =========
+def probe_address(bus, address):
+    """Returns True if a device ACKs at 'address' (a one-byte read, like `i2cdetect -r`)."""
+    try:
+        bus.read_byte(address)
+        return True
+    except OSError:
+        return False
 
 def read_mcp9808_temperature(bus, address):
     """Reads temperature from an MCP9808 sensor."""
@@ -110,7 +213,7 @@ def read_mcp9808_temperature(bus, address):
             temp -= 256
         return temp
     except Exception as e:
-        print(f"[MCP9808] Read failed @ 0x{address:02X}: {e}")
+        log_limited(('mcp9808', address), f"[MCP9808] Read failed @ 0x{address:02X}: {e}")
         return None
 
 def read_temperature(bus, address):
@@ -119,152 +222,674 @@ def read_temperature(bus, address):
         return read_mcp9808_temperature(bus, address)
     return None
 
-# ========= GPIO MONITOR (Updated to send 1/0) =========
-def collect_gpio_statuses(gpio_queue):
-    """Runs the C executable to monitor GPIO states and puts results in a queue."""
-    try:
-        process = subprocess.Popen(
-            ['sudo', GPIO_EXECUTABLE],
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True,
-            bufsize=1
-        )
-        print("[GPIO] Started GPIO monitoring executable")
+# ========= GPIO MONITOR =========
+class GpioState:
+    """
+    Pin levels as reported by the gpio3 stream, plus the transitions that
+    have not been turned into samples yet. gpio3 speaks a line protocol:
+        S <t_ns> <pin>=<level> ...   full state (startup and heartbeat)
+        E <t_ns> <pin> <level>       one pin changed
+    where <t_ns> is CLOCK_MONOTONIC in nanoseconds.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pins = []     # In the order gpio3 reports them
+        self.levels = {}
+        self.edges = []    # (wall-clock time, statuses after the edge)
+        self.dropped_edges = 0
+
+    def _statuses(self):
+        return [self.levels[pin] for pin in self.pins]
+
+    @staticmethod
+    def _wall_time(t_ns):
+        """
+        time.monotonic() reads the same clock as gpio3, so the line's age is
+        exact; subtracting it from the current wall clock, rather than adding
+        an offset taken once at startup, keeps edge times in step with
+        time.time() after NTP steps the wall clock.
+        """
+        age = max(0.0, time.monotonic() - t_ns / 1e9)
+        return time.time() - age
+
+    def _record_edge(self, wall_time):
+        if len(self.edges) >= MAX_PENDING_GPIO_EDGES:
+            self.edges.pop(0)
+            self.dropped_edges += 1
+        self.edges.append((wall_time, self._statuses()))
 
+    def apply_line(self, line):
+        """Applies one protocol line. Returns False if the line is not understood."""
+        fields = line.split()
+        if len(fields) < 2 or fields[0] not in ('S', 'E') or not fields[1].isdigit():
+            return False
+        wall_time = self._wall_time(int(fields[1]))
+
+        with self.lock:
+            if fields[0] == 'E':
+                if len(fields) != 4 or not fields[2].isdigit() or fields[3] not in ('0', '1'):
+                    return False
+                pin, level = int(fields[2]), int(fields[3])
+                if pin not in self.levels:
+                    self.pins.append(pin)
+                self.levels[pin] = level
+                self._record_edge(wall_time)
+                return True
+
+            pins, levels = [], {}
+            for field in fields[2:]:
+                pin, _, level = field.partition('=')
+                if not pin.isdigit() or level not in ('0', '1'):
+                    return False
+                pins.append(int(pin))
+                levels[int(pin)] = int(level)
+            # A heartbeat that disagrees with our state means transitions were missed.
+            missed = bool(self.levels) and levels != self.levels
+            self.pins, self.levels = pins, levels
+            if missed:
+                self._record_edge(wall_time)
+            return True
+
+    def snapshot(self):
+        with self.lock:
+            return list(self.pins), self._statuses()
+
+    def drain_edges(self):
+        with self.lock:
+            edges, self.edges = self.edges, []
+            return edges
+
+    def reset(self):
+        """Forgets all levels, e.g. when gpio3 has died and the levels are unknown."""
+        with self.lock:
+            self.pins, self.levels = [], {}
+
+# ========= I2C TOPOLOGY CACHE =========
+class I2CTopology:
+    """
+    Keeps one SMBus handle open and a cached map of where the temperature
+    sensors are: (mux address, mux channel, sensor address) for sensors
+    behind a TCA9548A, or (None, None, sensor address) for sensors on the
+    bus itself. The map is rebuilt by a background thread every
+    TOPOLOGY_RESCAN_INTERVAL seconds, or sooner when a read fails, so the
+    sampling loop only does register reads.
+    """
+    def __init__(self, bus_number):
+        self.bus_number = bus_number
+        self.bus = None
+        self.lock = threading.Lock()
+        self.rescan_event = threading.Event()
+        self.sensors = []
+        self.muxes = []
+
+    def _open_bus(self):
+        if self.bus is None:
+            self.bus = smbus2.SMBus(self.bus_number)
+        return self.bus
+
+    def _close_bus(self):
+        if self.bus is not None:
+            try:
+                self.bus.close()
+            except Exception:
+                pass
+            self.bus = None
+
+    def _deselect_muxes(self, bus):
+        """Makes sure no channel is left selected, or its devices would show up on the root bus."""
+        for mux_addr in self.muxes:
+            try:
+                bus.write_byte(mux_addr, 0)
+            except OSError:
+                pass
+
+    def scan(self):
+        """
+        Probes the bus and every mux channel, then swaps in the new map. The
+        lock is only held for one address or one mux channel at a time, so
+        the sampler keeps reading the cached sensors in between.
+        """
+        started = time.monotonic()
+        try:
+            with self.lock:
+                bus = self._open_bus()
+                self._deselect_muxes(bus)
+            addresses = []
+            for addr in I2C_SCAN_ADDRESS_RANGE:
+                with self.lock:
+                    if probe_address(bus, addr):
+                        addresses.append(addr)
+                # Locks are not fair; without a pause this thread would take it straight back.
+                time.sleep(TOPOLOGY_SCAN_STEP_PAUSE)
+            muxes = [addr for addr in addresses if addr in MUX_ADDRESS_RANGE]
+            sensors = []
+            if muxes:
+                # Handle sensors connected via a TCA9548A MUX
+                for mux_addr in muxes:
+                    for channel in range(8):
+                        with self.lock:
+                            try:
+                                bus.write_byte(mux_addr, 1 << channel) # Select channel
+                                for sensor_addr in TEMPERATURE_SENSOR_ADDRESSES:
+                                    if probe_address(bus, sensor_addr):
+                                        sensors.append((mux_addr, channel, sensor_addr))
+                            except OSError as e:
+                                print(f"[MUX] Channel {channel} scan error: {e}")
+                            bus.write_byte(mux_addr, 0) # Deselect all channels
+                        time.sleep(TOPOLOGY_SCAN_STEP_PAUSE)
+            else:
+                # Handle directly connected sensors
+                sensors = [(None, None, addr) for addr in addresses if addr in TEMPERATURE_SENSOR_ADDRESSES]
+        except OSError as e:
+            print(f"[I2C] Scan failed: {e}")
+            with self.lock:
+                self._close_bus()
+            muxes, sensors = [], []
+
+        with self.lock:
+            changed = (muxes, sensors) != (self.muxes, self.sensors)
+            self.muxes, self.sensors = muxes, sensors
+            self.rescan_event.clear()
+
+        if changed:
+            for mux_addr in muxes:
+                print(f"[MUX] Found at 0x{mux_addr:02X}")
+            print(f"[I2C] Topology: {len(sensors)} sensor(s) found in {(time.monotonic() - started) * 1000:.0f} ms")
+
+    def read_all(self):
+        """Reads every cached sensor. Any failure schedules a rescan."""
+        devices = []
+        with self.lock:
+            if self.bus is None:
+                return devices
+            selected_mux = None
+            try:
+                for mux_addr, channel, sensor_addr in self.sensors:
+                    if mux_addr is not None:
+                        # The TCA9548A switches on the STOP of this write; no settle delay is needed.
+                        self.bus.write_byte(mux_addr, 1 << channel)
+                        selected_mux = mux_addr
+                    temp = read_temperature(self.bus, sensor_addr)
+                    if temp is None:
+                        self.rescan_event.set()
+                        continue
+                    if mux_addr is not None:
+                        devices.append({"channel": channel, "temperature": round(temp, 2)})
+                    else:
+                        devices.append({"temperature": round(temp, 2)})
+                if selected_mux is not None:
+                    self.bus.write_byte(selected_mux, 0) # Deselect all channels
+            except OSError as e:
+                log_limited('i2c-read', f"[I2C] Read failed: {e}")
+                self.rescan_event.set()
+                # A rescan may probe the root bus before the next read; leave no channel selected.
+                self._deselect_muxes(self.bus)
+        return devices
+
+    def rescan_forever(self):
+        """
+        Background thread: rescans every TOPOLOGY_RESCAN_INTERVAL, or sooner
+        when a read failed, but never within TOPOLOGY_RESCAN_MIN_GAP of the
+        last scan, so a sensor that keeps failing cannot keep the bus busy.
+        """
         while True:
-            line = process.stdout.readline().strip()
-            if not line and process.poll() is not None:
-                print("[GPIO] Executable terminated unexpectedly")
-                break
+            time.sleep(TOPOLOGY_RESCAN_MIN_GAP)
+            self.rescan_event.wait(TOPOLOGY_RESCAN_INTERVAL - TOPOLOGY_RESCAN_MIN_GAP)
+            self.scan()
+
+# ========= STORE-AND-FORWARD SPOOL =========
+class SampleSpool:
+    """
+    A size-capped ring of samples on disk. Samples are appended as JSON lines
+    to numbered segment files; when the spool grows past SPOOL_MAX_BYTES the
+    oldest segments are deleted. The uploader reads from a persisted cursor
+    (segment, byte offset) and only advances it once the server has accepted
+    a batch, so a restart or an outage never loses spooled samples and memory
+    use does not depend on how long the server has been away.
+    """
+    def __init__(self, directory, segment_bytes=SPOOL_SEGMENT_BYTES, max_bytes=SPOOL_MAX_BYTES):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.evicted_segments = 0
+        os.makedirs(directory, exist_ok=True)
+        self.segments = sorted(int(name[4:-6]) for name in os.listdir(directory) if name.startswith('seg-') and name.endswith('.jsonl'))
+        self.cursor = self._load_cursor()
+        # Always start a fresh segment, so a line cut short by a crash is never appended to.
+        self.writer = None
+        self._open_segment((self.segments[-1] + 1) if self.segments else 0)
+
+    def _path(self, seq):
+        return os.path.join(self.directory, f"seg-{seq:010d}.jsonl")
+
+    def _load_cursor(self):
+        try:
+            with open(os.path.join(self.directory, 'cursor'), 'r') as f:
+                seq, offset = f.read().split()
+                return int(seq), int(offset)
+        except (OSError, ValueError):
+            return (self.segments[0], 0) if self.segments else (0, 0)
+
+    def _save_cursor(self):
+        path = os.path.join(self.directory, 'cursor')
+        with open(path + '.tmp', 'w') as f:
+            f.write(f"{self.cursor[0]} {self.cursor[1]}")
+        os.replace(path + '.tmp', path)
+
+    def _open_segment(self, seq):
+        if self.writer is not None:
+            self.writer.flush()
+            os.fsync(self.writer.fileno())
+            self.writer.close()
+        self.writer = open(self._path(seq), 'ab')
+        self.writer_seq = seq
+        self.writer_bytes = 0
+        if seq not in self.segments:
+            self.segments.append(seq)
+
+    def _enforce_cap(self):
+        sizes = {seq: os.path.getsize(self._path(seq)) for seq in self.segments}
+        total = sum(sizes.values())
+        while total > self.max_bytes and len(self.segments) > 1:
+            oldest = self.segments.pop(0)
+            os.remove(self._path(oldest))
+            total -= sizes[oldest]
+            self.evicted_segments += 1
+            log_limited('spool-full', f"[SPOOL] Spool full, dropped oldest segment {oldest} ({sizes[oldest]} bytes)")
 
-            if line.startswith("GPIO"):
-                statuses = []
-                pins = []
-                # Regex to find all instances of "GPIO <pin>: <STATE>" in a line
-                matches = re.findall(r'GPIO (\d+): (HIGH|LOW)', line)
-                for pin, state in matches:
-                    # Convert the text state "HIGH" or "LOW" to a number (1 or 0)
-                    status = 1 if state == "HIGH" else 0
-                    pins.append(int(pin))
-                    statuses.append(status)
-
-                if statuses:
-                    # Clear the queue to ensure only the latest data is present
-                    while not gpio_queue.empty():
+    def append_many(self, samples):
+        """Appends samples with a single flush at the end."""
+        lines = [(json.dumps(sample, separators=(',', ':')) + '\n').encode() for sample in samples]
+        with self.lock:
+            for line in lines:
+                if self.writer_bytes and self.writer_bytes + len(line) > self.segment_bytes:
+                    self._open_segment(self.writer_seq + 1)
+                    self._enforce_cap()
+                self.writer.write(line)
+                self.writer_bytes += len(line)
+            self.writer.flush()
+
+    def append(self, sample):
+        self.append_many([sample])
+
+    def read_batch(self, max_samples):
+        """Returns up to 'max_samples' samples from the cursor, and the position just after them."""
+        with self.lock:
+            segments = list(self.segments)
+            seq, offset = self.cursor
+        if seq not in segments:
+            # The cursor's segment was dropped by the size cap; carry on from the oldest one left.
+            later = [s for s in segments if s > seq]
+            if not later:
+                return [], (seq, offset)
+            seq, offset = later[0], 0
+
+        samples = []
+        while len(samples) < max_samples:
+            try:
+                with open(self._path(seq), 'rb') as f:
+                    f.seek(offset)
+                    for line in f:
+                        if not line.endswith(b'\n'):
+                            break # Still being written
+                        offset += len(line)
                         try:
-                            gpio_queue.get_nowait()
-                        except queue.Empty:
+                            samples.append(json.loads(line))
+                        except ValueError:
+                            continue
+                        if len(samples) >= max_samples:
                             break
-                    gpio_queue.put({'pins': pins, 'statuses': statuses})
-    except Exception as e:
-        print(f"[GPIO] Error running executable: {e}")
-        # Put an empty list to signal an error state
-        gpio_queue.put({'pins': [], 'statuses': []})
-
-# ========= DATA AGGREGATION AND SENDING =========
-def collect_all_temperature_data():
-    """Scans all I2C devices, including those behind a MUX, and reads temperature."""
-    data = {"i2c_devices": []}
-    try:
-        bus = smbus2.SMBus(I2C_BUS)
-        all_addresses = get_i2c_addresses()
-        mux_addresses = [addr for addr in all_addresses if addr in MUX_ADDRESS_RANGE]
+            except FileNotFoundError:
+                pass
+            if len(samples) >= max_samples:
+                break
+            later = [s for s in segments if s > seq]
+            if not later:
+                break
+            seq, offset = later[0], 0
+        return samples, (seq, offset)
 
-        if mux_addresses:
-            # Handle sensors connected via a TCA9548A MUX
-            for mux_addr in mux_addresses:
-                print(f"[MUX] Found at 0x{mux_addr:02X}")
-                for channel in range(8): # Iterate through all 8 channels of the MUX
-                    try:
-                        bus.write_byte(mux_addr, 1 << channel) # Select channel
-                        time.sleep(0.05)
-                        # Check only for the MCP9808 address on the selected channel
-                        if 0x18 in get_i2c_addresses():
-                             temp = read_temperature(bus, 0x18)
-                             if temp is not None:
-                                 data["i2c_devices"].append({
-                                     "channel": channel,
-                                     "temperature": round(temp, 2)
-                                 })
-                    except Exception as e:
-                        print(f"[MUX] Channel {channel} scan error: {e}")
-                bus.write_byte(mux_addr, 0) # Deselect all channels
-        else:
-            # Handle directly connected sensors
-            for addr in all_addresses:
-                if addr in TEMPERATURE_SENSOR_ADDRESSES:
-                    temp = read_temperature(bus, addr)
-                    if temp is not None:
-                        data["i2c_devices"].append({
-                            "temperature": round(temp, 2)
-                        })
-        bus.close()
-    except Exception as e:
-        print(f"[I2C] Scan failed: {e}")
-    return data
+    def commit(self, position):
+        """Marks everything before 'position' as delivered and deletes fully delivered segments."""
+        with self.lock:
+            self.cursor = position
+            self._save_cursor()
+            while self.segments and self.segments[0] < position[0]:
+                try:
+                    os.remove(self._path(self.segments.pop(0)))
+                except FileNotFoundError:
+                    pass
 
-# ========= MAIN LOOP =========
-def main():
-    print("[SYSTEM] Starting Temperature and GPIO Monitor")
-    gpio_queue = queue.Queue(maxsize=1)
-    gpio_thread = threading.Thread(target=collect_gpio_statuses, args=(gpio_queue,), daemon=True)
-    gpio_thread.start()
+# ========= WIRE FORMAT =========
+# Binary batch layout; must match decode_telemetry_batch() in server/app.py.
+#   header: b'IT', schema id (u8), client id length (u8), client id (utf-8),
+#           base time in epoch ms (i64), sample count (u32),
+#           temperature channel mask (u8), humidity channel mask (u8)
+#   sample: time delta in ms from the previous sample (i32), GPIO presence mask (u8),
+#           GPIO levels (u8), then one i16 per channel set in each mask, in
+#           hundredths of a unit, with -32768 meaning null.
+TELEMETRY_MIMETYPE = "application/vnd.iot.telemetry"
+TELEMETRY_SCHEMA_ID = 1
+TELEMETRY_NULL = -32768
 
-    server_address = None
-    gpio_data = {'pins': [], 'statuses': []}
-    discovery_count = 0
+def sample_channels(sample):
+    """Maps a sample onto 8 temperature, humidity and GPIO slots, the way the server does for JSON."""
+    temps, hums, gpios = [None] * 8, [None] * 8, [None] * 8
+    direct_channel = 0
+    for device in sample.get('i2c_devices') or []:
+        channel = device.get('channel')
+        if channel is None:
+            while direct_channel < 8 and temps[direct_channel] is not None:
+                direct_channel += 1
+            channel = direct_channel
+        if 0 <= channel < 8:
+            temps[channel] = device.get('temperature')
+            hums[channel] = device.get('humidity')
+    for index, status in enumerate((sample.get('gpio_statuses') or [])[:8]):
+        gpios[index] = status
+    return temps, hums, gpios
+
+def _fixed_point(value):
+    """Hundredths as an i16. Values it cannot hold (a faulty sensor) are sent as null rather than clamped."""
+    if value is None or not math.isfinite(value):
+        return TELEMETRY_NULL
+    scaled = round(value * 100)
+    return scaled if -32767 <= scaled <= 32767 else TELEMETRY_NULL
+
+def telemetry_batch_span(samples):
+    """
+    How many leading samples fit in one binary batch. Time deltas are i32
+    milliseconds (about 24.8 days), so a clock jump, such as NTP setting a
+    clock that started at 1970, has to start a new batch.
+    """
+    previous_ms = round(samples[0]['timestamp'] * 1000)
+    for count, sample in enumerate(samples[1:], 1):
+        sample_ms = round(sample['timestamp'] * 1000)
+        if not -2**31 <= sample_ms - previous_ms < 2**31:
+            return count
+        previous_ms = sample_ms
+    return len(samples)
+
+def encode_telemetry_batch(samples):
+    """Packs samples from one client into a binary telemetry batch."""
+    client_id = samples[0]['client_id'].encode('utf-8')
+    channels = [sample_channels(sample) for sample in samples]
+    temp_mask = hum_mask = 0
+    for temps, hums, _ in channels:
+        for channel in range(8):
+            if temps[channel] is not None:
+                temp_mask |= 1 << channel
+            if hums[channel] is not None:
+                hum_mask |= 1 << channel
+    temp_channels = [channel for channel in range(8) if temp_mask & (1 << channel)]
+    hum_channels = [channel for channel in range(8) if hum_mask & (1 << channel)]
+    record = struct.Struct('<iBB' + 'h' * (len(temp_channels) + len(hum_channels)))
+
+    base_ms = round(samples[0]['timestamp'] * 1000)
+    parts = [struct.pack('<2sBB', b'IT', TELEMETRY_SCHEMA_ID, len(client_id)), client_id,
+             struct.pack('<qIBB', base_ms, len(samples), temp_mask, hum_mask)]
+    previous_ms = base_ms
+    for sample, (temps, hums, gpios) in zip(samples, channels):
+        sample_ms = round(sample['timestamp'] * 1000)
+        gpio_mask = gpio_bits = 0
+        for channel, level in enumerate(gpios):
+            if level is not None:
+                gpio_mask |= 1 << channel
+                gpio_bits |= (level & 1) << channel
+        parts.append(record.pack(sample_ms - previous_ms, gpio_mask, gpio_bits,
+                                 *[_fixed_point(temps[channel]) for channel in temp_channels],
+                                 *[_fixed_point(hums[channel]) for channel in hum_channels]))
+        previous_ms = sample_ms
+    return b''.join(parts)
+
+# ========= PIPELINE STAGES =========
+def offer(sample_queue, sample, stats):
+    """Queues a sample without blocking; when the queue is full the oldest sample is dropped."""
+    try:
+        sample_queue.put_nowait(sample)
+    except asyncio.QueueFull:
+        sample_queue.get_nowait()
+        sample_queue.put_nowait(sample)
+        stats['dropped_samples'] += 1
 
+async def gpio_reader(gpio_state, stats):
+    """Runs gpio3 and feeds its protocol lines into 'gpio_state', restarting it whenever it exits."""
+    command = (['sudo'] if GPIO_USE_SUDO else []) + shlex.split(GPIO_EXECUTABLE)
     while True:
-        # Check if we need to search for the server
-        if server_address is None and discovery_count % 30 == 0:
-            server_address = find_server()
-        discovery_count += 1
-        
-        # Watchdog to restart the GPIO thread if it dies
-        if not gpio_thread.is_alive():
-            print("[WATCHDOG] GPIO thread died. Restarting...")
-            gpio_thread = threading.Thread(target=collect_gpio_statuses, args=(gpio_queue,), daemon=True)
-            gpio_thread.start()
-
-        # Collect data from sensors
-        sensor_data = collect_all_temperature_data()
-        time.sleep(0.05) # Small delay
-
-        # Get the latest GPIO data from the queue
         try:
-            gpio_data = gpio_queue.get_nowait()
-        except queue.Empty:
-            pass # It's okay if there's no new data yet
+            process = await asyncio.create_subprocess_exec(*command, stdout=subprocess.PIPE)
+            print("[GPIO] Started GPIO monitoring executable")
+            async for raw_line in process.stdout:
+                line = raw_line.decode(errors='replace').strip()
+                if line and not gpio_state.apply_line(line):
+                    log_limited('gpio-line', f"[GPIO] Ignoring unrecognised line: {line}")
+            await process.wait()
+            print(f"[WATCHDOG] GPIO executable exited with code {process.returncode}. Restarting...")
+        except Exception as e:
+            print(f"[GPIO] Error running executable: {e}")
+        # Report no GPIO data rather than stale levels
+        gpio_state.reset()
+        stats['gpio_restarts'] += 1
+        await asyncio.sleep(GPIO_RESTART_DELAY)
+
+async def sensor_sampler(topology, gpio_state, sample_queue, stats):
+    """
+    Samples on a fixed SAMPLE_INTERVAL schedule. The I2C sweep runs in a
+    worker thread and the results only go into a bounded queue, so neither the
+    disk nor the network can shift the cadence.
+    """
+    loop = asyncio.get_running_loop()
+    client_ip, client_ip_checked = get_local_ip(), loop.time()
+    next_tick = loop.time()
+    while True:
+        i2c_devices = await asyncio.to_thread(topology.read_all)
+        if loop.time() - client_ip_checked > LOG_INTERVAL:
+            client_ip, client_ip_checked = get_local_ip(), loop.time()
+
+        # Every GPIO transition since the last cycle becomes its own sample, stamped
+        # with the edge time, so alarm start/end times are not rounded to the cycle.
+        pins, _ = gpio_state.snapshot()
+        for edge_time, edge_statuses in gpio_state.drain_edges():
+            offer(sample_queue, {
+                "client_id": CLIENT_ID,
+                "timestamp": round(edge_time, 6),
+                "client_ip": client_ip,
+                "i2c_devices": i2c_devices,
+                "gpio_statuses": edge_statuses,
+                "gpio_pins": pins[:len(edge_statuses)]
+            }, stats)
 
-        # Assemble the final payload to send to the server
-        payload = {
+        pins, statuses = gpio_state.snapshot()
+        sample = {
             "client_id": CLIENT_ID,
-            "client_ip": get_local_ip(),
-            "i2c_devices": sensor_data["i2c_devices"],
-            "gpio_statuses": gpio_data['statuses'],
-            "gpio_pins": gpio_data['pins']
+            "timestamp": round(time.time(), 3), # Capture time, so spooled samples keep their real time
+            "client_ip": client_ip,
+            "i2c_devices": i2c_devices,
+            "gpio_statuses": statuses,
+            "gpio_pins": pins
         }
+        offer(sample_queue, sample, stats)
+        stats['samples'] += 1
+        stats['last_sample'] = sample
+
+        next_tick += SAMPLE_INTERVAL
+        delay = next_tick - loop.time()
+        if delay < 0:
+            # The sweep overran its slot; skip the missed ticks instead of bursting to catch up.
+            stats['overruns'] += 1
+            next_tick, delay = loop.time(), 0
+        await asyncio.sleep(delay)
+
+async def batcher(sample_queue, spool, stats):
+    """Moves queued samples to the disk spool every BATCH_INTERVAL, one write and flush per batch."""
+    while True:
+        samples = [await sample_queue.get()]
+        await asyncio.sleep(BATCH_INTERVAL)
+        while not sample_queue.empty():
+            samples.append(sample_queue.get_nowait())
+        try:
+            await asyncio.to_thread(spool.append_many, samples)
+            stats['spooled'] += len(samples)
+        except OSError as e:
+            stats['dropped_samples'] += len(samples)
+            log_limited('spool-write', f"[SPOOL] Failed to write {len(samples)} samples: {e}")
+
+async def uploader(spool, stats):
+    """
+    Drains the spool in batches over one keep-alive HTTP session. Failed
+    uploads are retried with exponential backoff; the server's Retry-After is
+    honoured when it asks the gateway to slow down. Blocking calls run in
+    worker threads so they never hold up the other stages.
+    """
+    session = requests.Session()
+    server_address = None
+    wire_format = WIRE_FORMAT
+    backoff = UPLOAD_BACKOFF_INITIAL
+    batch_limit = UPLOAD_BATCH_SIZE
 
-        print("[DATA] Sending to server:")
-        # Print the payload without the "gpio_pins" key for a cleaner output
-        payload_to_print = payload.copy()
-        payload_to_print.pop('gpio_pins', None)
-        print(json.dumps(payload_to_print, indent=2))
-        
-        # Only try to send data if a server address has been found
-        if server_address:
-            SERVER_URL = f"http://{server_address[0]}:{server_address[1]}{SERVER_UPDATE_ENDPOINT}"
+    async def wait_and_back_off(delay=None, probe=False):
+        """
+        Sleeps for 'delay' (the current backoff by default) and doubles the
+        backoff. With 'probe', the last known server is health-checked every
+        KNOWN_SERVER_PROBE_INTERVAL meanwhile, and the wait ends and the backoff
+        resets as soon as it answers, so a restarted server is reached at once.
+        """
+        nonlocal backoff
+        deadline = time.monotonic() + (delay if delay is not None else backoff)
+        backoff = min(backoff * 2, UPLOAD_BACKOFF_MAX)
+        known = await asyncio.to_thread(load_known_server) if probe else None
+        while (remaining := deadline - time.monotonic()) > 0:
+            if known is None:
+                await asyncio.sleep(remaining)
+                return
+            await asyncio.sleep(min(remaining, KNOWN_SERVER_PROBE_INTERVAL))
+            if await asyncio.to_thread(probe_known_server, known) is not None:
+                backoff = UPLOAD_BACKOFF_INITIAL
+                return
+
+    while True:
+        samples, position = await asyncio.to_thread(spool.read_batch, batch_limit)
+        if not samples:
+            await asyncio.sleep(UPLOAD_INTERVAL)
+            continue
+
+        if server_address is None:
+            server_address = await asyncio.to_thread(find_server)
+            if server_address is None:
+                await wait_and_back_off(probe=True)
+                continue
+            wire_format = WIRE_FORMAT
+
+        body = None
+        if wire_format == "binary":
+            try:
+                span = telemetry_batch_span(samples)
+                if span == len(samples):
+                    body = encode_telemetry_batch(samples)
+            except (struct.error, ValueError, TypeError, OverflowError) as e:
+                # The JSON path lets the server reject the bad sample by index instead.
+                log_limited('encode', f"[ERROR] Could not encode a binary batch, sending it as JSON: {e}")
+                span = len(samples)
+            if span < len(samples):
+                # The clock jumped inside this batch; send the samples before the jump on their own.
+                batch_limit = span
+                continue
+
+        server_url = f"http://{server_address[0]}:{server_address[1]}{SERVER_UPDATE_ENDPOINT}"
+        try:
+            if body is not None:
+                res = await asyncio.to_thread(session.post, server_url, data=body,
+                                              headers={"Content-Type": TELEMETRY_MIMETYPE}, timeout=UPLOAD_TIMEOUT)
+            else:
+                res = await asyncio.to_thread(session.post, server_url, json=samples, timeout=UPLOAD_TIMEOUT)
+        except requests.RequestException as e:
+            stats['upload_failures'] += 1
+            log_limited('upload', f"[ERROR] Failed to send data to {server_url}: {e}")
+            server_address = None # Trigger re-discovery on the next attempt
+            await wait_and_back_off(probe=True)
+            continue
+        stats['last_response'] = res.status_code
+
+        if wire_format == "binary" and res.status_code == 415:
+            # Older servers only understand JSON; resend the same batch that way.
+            print(f"[SERVER] Binary upload refused ({res.status_code}), falling back to JSON")
+            wire_format = "json"
+            continue
+        if res.status_code in (200, 201, 202):
+            await asyncio.to_thread(spool.commit, position)
+            stats['uploaded'] += len(samples)
+            stats['uploads'] += 1
+            backoff = UPLOAD_BACKOFF_INITIAL
+            if len(samples) < batch_limit:
+                # Caught up; let the next batch accumulate.
+                await asyncio.sleep(UPLOAD_INTERVAL)
+            batch_limit = UPLOAD_BATCH_SIZE
+        elif res.status_code == 400:
+            # The server rejects the whole batch at the first invalid sample. Upload the
+            # samples before it, then drop it so it cannot block the spool forever.
+            # This applies to binary batches too; only 415 means binary is not understood.
             try:
-                # Send the data as a JSON POST request
-                res = requests.post(SERVER_URL, json=payload, timeout=5)
-                print(f"[SERVER] Response: {res.status_code}")
-            except Exception as e:
-                print(f"[ERROR] Failed to send data to {SERVER_URL}: {e}")
-                server_address = None # Reset server address on failure to trigger re-discovery
+                index = res.json().get('index')
+                index = int(index) if index is not None else None
+            except (ValueError, AttributeError, TypeError):
+                index = None
+            if index is not None and index > 0:
+                batch_limit = index
+            elif index is None and wire_format == "binary" and len(samples) > 1:
+                # A binary batch is refused as a whole; halve it until the bad sample is alone.
+                batch_limit = len(samples) // 2
+            else:
+                print(f"[ERROR] Server rejected a sample, dropping it: {res.text.strip()}")
+                _, position = await asyncio.to_thread(spool.read_batch, 1)
+                await asyncio.to_thread(spool.commit, position)
+                stats['rejected_samples'] += 1
+                batch_limit = UPLOAD_BATCH_SIZE
+        else:
+            stats['upload_failures'] += 1
+            log_limited('upload', f"[SERVER] Response: {res.status_code}, will retry")
+            retry_after = res.headers.get('Retry-After', '')
+            await wait_and_back_off(float(retry_after) if retry_after.isdigit() else None)
 
-        # Wait before the next cycle
-        time.sleep(SEND_INTERVAL)
+async def stats_reporter(spool, gpio_state, sample_queue, stats):
+    """Prints one status line every LOG_INTERVAL instead of logging every sample."""
+    while True:
+        await asyncio.sleep(LOG_INTERVAL)
+        print(f"[STATS] samples={stats['samples']} overruns={stats['overruns']} queued={sample_queue.qsize()} "
+              f"dropped={stats['dropped_samples']} dropped_edges={gpio_state.dropped_edges} spooled={stats['spooled']} "
+              f"uploaded={stats['uploaded']} uploads={stats['uploads']} upload_failures={stats['upload_failures']} "
+              f"rejected={stats['rejected_samples']} spool_segments={len(spool.segments)} evicted_segments={spool.evicted_segments} "
+              f"last_response={stats['last_response']}")
+        if stats['last_sample']:
+            last_sample = dict(stats['last_sample'])
+            last_sample.pop('gpio_pins', None)
+            print(f"[DATA] Last sample: {json.dumps(last_sample)}")
+
+# ========= MAIN LOOP =========
+async def run_pipeline():
+    print("[SYSTEM] Starting Temperature and GPIO Monitor")
+    topology = I2CTopology(I2C_BUS)
+    await asyncio.to_thread(topology.scan)
+    threading.Thread(target=topology.rescan_forever, daemon=True).start()
+
+    spool = SampleSpool(os.path.join(os.path.dirname(os.path.abspath(__file__)), SPOOL_DIRECTORY))
+    gpio_state = GpioState()
+    sample_queue = asyncio.Queue(maxsize=SAMPLE_QUEUE_SIZE)
+    stats = {
+        "samples": 0, "overruns": 0, "dropped_samples": 0, "spooled": 0, "uploaded": 0, "uploads": 0,
+        "upload_failures": 0, "rejected_samples": 0, "gpio_restarts": 0, "last_response": None, "last_sample": None
+    }
+
+    await asyncio.gather(
+        gpio_reader(gpio_state, stats),
+        sensor_sampler(topology, gpio_state, sample_queue, stats),
+        batcher(sample_queue, spool, stats),
+        uploader(spool, stats),
+        stats_reporter(spool, gpio_state, sample_queue, stats)
+    )
+
+def main():
+    asyncio.run(run_pipeline())
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
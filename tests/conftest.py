@@ -0,0 +1,68 @@
+import importlib.util
+import itertools
+import os
+import shutil
+import sys
+
+import pytest
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SERVER_PATH = os.path.join(REPO_ROOT, 'server', 'app.py')
+GATEWAY_DIR = os.path.join(REPO_ROOT, 'gateway')
+
+_server_copies = itertools.count()
+
+
+@pytest.fixture
+def load_server(tmp_path, monkeypatch):
+    """Returns a loader that imports a fresh copy of server/app.py against a database URL."""
+    def load(database_url):
+        shutil.copy(os.path.join(REPO_ROOT, 'config.json'), tmp_path)
+        monkeypatch.chdir(tmp_path)
+        monkeypatch.setenv('IOT_DATABASE_URL', database_url)
+        name = f'iot_server_{next(_server_copies)}'
+        spec = importlib.util.spec_from_file_location(name, SERVER_PATH)
+        module = importlib.util.module_from_spec(spec)
+        sys.modules[name] = module
+        spec.loader.exec_module(module)
+        return module
+    return load
+
+
+@pytest.fixture
+def server(load_server, tmp_path):
+    """The server against a scratch SQLite database."""
+    return load_server(f"sqlite:///{tmp_path / 'iot.db'}")
+
+
+@pytest.fixture(scope='session')
+def postgres_url(tmp_path_factory):
+    """IOT_TEST_DATABASE_URL (a scratch database, emptied by the tests), or a throwaway pgserver instance."""
+    url = os.environ.get('IOT_TEST_DATABASE_URL')
+    if url:
+        return url
+    pgserver = pytest.importorskip('pgserver')
+    data_dir = tmp_path_factory.mktemp('pgdata')
+    instance = pgserver.get_server(str(data_dir), cleanup_mode='stop')
+    return instance.get_uri()
+
+
+@pytest.fixture
+def postgres_server(load_server, postgres_url):
+    """The server against an empty PostgreSQL database."""
+    from sqlalchemy import create_engine, text
+    engine = create_engine(postgres_url)
+    with engine.begin() as connection:
+        connection.execute(text("DROP SCHEMA public CASCADE"))
+        connection.execute(text("CREATE SCHEMA public"))
+    engine.dispose()
+    return load_server(postgres_url)
+
+
+@pytest.fixture(scope='session')
+def gateway():
+    """gateway/nanopi_client.py, imported as a module."""
+    pytest.importorskip('smbus2')
+    sys.path.insert(0, GATEWAY_DIR)
+    import nanopi_client
+    return nanopi_client
@@ -0,0 +1,86 @@
+import datetime
+
+from sqlalchemy import insert, select
+
+START = datetime.datetime(2026, 10, 16, 12, 0, tzinfo=datetime.timezone.utc)
+
+
+def _insert(server, *levels, first=0):
+    """One 'pi-lab' reading per level on GPIO 2, ten seconds apart."""
+    rows = [{"client_id": "pi-lab", "created_at": _at(first + index), "gpio2": level, "temp0": 21.5} for index, level in enumerate(levels)]
+    with server.app.app_context():
+        server.db.session.execute(insert(server.Readings), rows)
+        server.db.session.commit()
+
+
+def _at(index):
+    return START + datetime.timedelta(seconds=10 * index)
+
+
+def _process(server):
+    """One pass of the alarm worker, rebuilding its edge state from the database as it does after a restart."""
+    with server.app.app_context():
+        server.prepare_alarm_shards(1)
+        server.seed_alarm_processor_state()
+        state = server.db.session.get(server.AlarmProcessorState, 1)
+        server.process_alarm_chunk(state)
+
+
+def _alarms(server):
+    with server.app.app_context():
+        rows = server.db.session.execute(
+            select(server.AlarmEvents.pin_index, server.AlarmEvents.event_start_time, server.AlarmEvents.event_end_time)
+            .where(server.AlarmEvents.client_id == 'pi-lab').order_by(server.AlarmEvents.event_start_time)
+        ).all()
+    return [(pin_index, server._as_utc(start), end and server._as_utc(end)) for pin_index, start, end in rows]
+
+
+def test_alarm_runs_from_the_first_high_to_the_first_low_reading(server):
+    _insert(server, 0, 1, 1, None, 0, 0, 1)
+    _process(server)
+    assert _alarms(server) == [(2, _at(1), _at(4)), (2, _at(6), None)]
+
+    # The open alarm survives a restart and is closed by the next LOW reading.
+    _insert(server, 1, 0, first=7)
+    _process(server)
+    assert _alarms(server) == [(2, _at(1), _at(4)), (2, _at(6), _at(8))]
+
+
+def test_live_state_reports_the_same_interval(server):
+    _insert(server, 0, 1, 1, 0, 0)
+    _process(server)
+    with server.app.app_context():
+        server.live_state.seed_from_database()
+        server.live_state.catch_up()
+    pin = server.live_state.clients['pi-lab']['pins'][2]
+    assert (server._as_utc(pin['start_time']), server._as_utc(pin['end_time'])) == (_at(1), _at(3))
+
+
+def test_shard_of_a_client_never_changes(server):
+    # md5 of the client id, not hash(): the same on every process, restart and Python version.
+    assert server.client_hash('pi-lab') == 0x892a1e5    # md5('pi-lab') starts with 892a1e5
+    assert [server.alarm_shard_of(client_id, 4) for client_id in ('pi-lab', 'esp/32')] == [1, 1]
+
+
+def _sql_shards(server, client_ids, shards):
+    rows = [{"client_id": client_id, "created_at": START, "temp0": 21.5} for client_id in client_ids]
+    with server.app.app_context():
+        server.db.session.execute(insert(server.Readings), rows)
+        server.db.session.commit()
+        return {shard: set(server.db.session.execute(
+                    select(server.Readings.client_id).where(server._alarm_shard_clause(shard, shards))).scalars())
+                for shard in range(shards)}
+
+
+def _python_shards(server, client_ids, shards):
+    return {shard: {client_id for client_id in client_ids if server.alarm_shard_of(client_id, shards) == shard} for shard in range(shards)}
+
+
+def test_sql_shard_clause_matches_python(server):
+    client_ids = [f"gateway-{index}" for index in range(60)] + ['esp/32', 'pi lab', 'µ-node']
+    assert _sql_shards(server, client_ids, 4) == _python_shards(server, client_ids, 4)
+
+
+def test_postgresql_shard_clause_matches_python(postgres_server):
+    client_ids = [f"gateway-{index}" for index in range(60)] + ['esp/32', 'pi lab', 'µ-node']
+    assert _sql_shards(postgres_server, client_ids, 4) == _python_shards(postgres_server, client_ids, 4)
@@ -0,0 +1,100 @@
+import pytest
+
+
+class FakeClock:
+    """Stands in for the gateway's time module: a monotonic clock and a wall clock that can be stepped."""
+    def __init__(self, monotonic, wall):
+        self.now_monotonic = monotonic
+        self.wall_offset = wall - monotonic
+
+    def monotonic(self):
+        return self.now_monotonic
+
+    def time(self):
+        return self.now_monotonic + self.wall_offset
+
+    def advance(self, seconds):
+        self.now_monotonic += seconds
+
+
+@pytest.fixture
+def clock(gateway, monkeypatch):
+    fake = FakeClock(monotonic=1000.0, wall=1_800_000_000.0)
+    monkeypatch.setattr(gateway, 'time', fake)
+    return fake
+
+
+def _ns(seconds):
+    return int(seconds * 1e9)
+
+
+def test_state_line_sets_pins_in_reported_order(gateway, clock):
+    state = gateway.GpioState()
+    assert state.apply_line(f"S {_ns(1000)} 7=1 0=0 12=1")
+    assert state.snapshot() == ([7, 0, 12], [1, 0, 1])
+    assert state.drain_edges() == []
+
+
+def test_edge_line_updates_one_pin_and_records_the_transition(gateway, clock):
+    state = gateway.GpioState()
+    state.apply_line(f"S {_ns(1000)} 7=1 0=0")
+    clock.advance(0.5)
+    assert state.apply_line(f"E {_ns(1000.2)} 0 1")
+    assert state.snapshot() == ([7, 0], [1, 1])
+    [(edge_time, statuses)] = state.drain_edges()
+    assert statuses == [1, 1]
+    # Stamped when it happened, not when it was read.
+    assert edge_time == pytest.approx(clock.time() - 0.3)
+
+
+def test_heartbeat_that_disagrees_records_a_missed_transition(gateway, clock):
+    state = gateway.GpioState()
+    state.apply_line(f"S {_ns(1000)} 7=1 0=0")
+    assert state.apply_line(f"S {_ns(1000)} 7=1 0=0")
+    assert state.drain_edges() == []
+    assert state.apply_line(f"S {_ns(1000)} 7=0 0=0")
+    assert [statuses for _, statuses in state.drain_edges()] == [[0, 0]]
+
+
+@pytest.mark.parametrize('line', [
+    "",
+    "X 1 0 1",
+    "E abc 0 1",
+    "E 100 0",
+    "E 100 0 2",
+    "E 100 x 1",
+    "S 100 7=1 0=2",
+    "S 100 7:1",
+])
+def test_malformed_lines_are_refused_without_changing_state(gateway, clock, line):
+    state = gateway.GpioState()
+    state.apply_line(f"S {_ns(1000)} 7=1")
+    assert not state.apply_line(line)
+    assert state.snapshot() == ([7], [1])
+    assert state.drain_edges() == []
+
+
+def test_pending_edges_are_capped(gateway, clock, monkeypatch):
+    monkeypatch.setattr(gateway, 'MAX_PENDING_GPIO_EDGES', 3)
+    state = gateway.GpioState()
+    for level in (1, 0, 1, 0, 1):
+        state.apply_line(f"E {_ns(1000)} 4 {level}")
+    assert len(state.drain_edges()) == 3
+    assert state.dropped_edges == 2
+
+
+def test_edge_times_follow_an_ntp_step(gateway, clock):
+    state = gateway.GpioState()
+    state.apply_line(f"S {_ns(1000)} 4=0")
+    clock.advance(10)
+    state.apply_line(f"E {_ns(1010)} 4 1")
+    [(before_step, _)] = state.drain_edges()
+    assert before_step == pytest.approx(clock.time())
+
+    # NTP steps the wall clock back an hour; the monotonic clock carries on.
+    clock.wall_offset -= 3600
+    clock.advance(1)
+    state.apply_line(f"E {_ns(1011)} 4 0")
+    [(after_step, _)] = state.drain_edges()
+    assert after_step == pytest.approx(clock.time())
+    assert after_step == pytest.approx(before_step + 1 - 3600)
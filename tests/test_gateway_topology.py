@@ -0,0 +1,42 @@
+import threading
+
+
+class FakeBus:
+    """A root bus with one MCP9808 at 0x18 and nothing else."""
+    def __init__(self, bus_number):
+        pass
+
+    def read_byte(self, address):
+        if address != 0x18:
+            raise OSError("no ACK")
+        return 0
+
+    def read_word_data(self, address, register):
+        return 0x9001    # 25.0 C, byte-swapped
+
+    def write_byte(self, address, value):
+        pass
+
+    def close(self):
+        pass
+
+
+def test_sampler_reads_between_the_probes_of_a_rescan(gateway, monkeypatch):
+    monkeypatch.setattr(gateway.smbus2, 'SMBus', FakeBus)
+    topology = gateway.I2CTopology(0)
+    topology.scan()
+    assert topology.sensors == [(None, None, 0x18)]
+
+    probe_address = gateway.probe_address
+    read_during_scan = threading.Event()
+    def probe_while_sampling(bus, address):
+        if address == gateway.I2C_SCAN_ADDRESS_RANGE[0]:
+            threading.Thread(target=lambda: topology.read_all() and read_during_scan.set()).start()
+        elif address == gateway.I2C_SCAN_ADDRESS_RANGE[-1]:
+            assert read_during_scan.wait(1)
+        return probe_address(bus, address)
+    monkeypatch.setattr(gateway, 'probe_address', probe_while_sampling)
+
+    topology.scan()
+    assert read_during_scan.is_set()
+    assert topology.sensors == [(None, None, 0x18)]
@@ -0,0 +1,77 @@
+import asyncio
+from collections import defaultdict
+
+import requests
+
+
+class FakeSession:
+    """Refuses the first connection, like a server that is restarting, then accepts every upload."""
+    def __init__(self):
+        self.posts = 0
+
+    def post(self, url, **kwargs):
+        self.posts += 1
+        if self.posts == 1:
+            raise requests.ConnectionError("connection refused")
+        response = requests.Response()
+        response.status_code = 200
+        return response
+
+
+class RecordingSession:
+    """Accepts every upload and keeps the request bodies."""
+    def __init__(self):
+        self.bodies = []
+
+    def post(self, url, data=None, json=None, **kwargs):
+        self.bodies.append(data if data is not None else json)
+        response = requests.Response()
+        response.status_code = 200
+        return response
+
+
+async def _upload_until(gateway, spool, stats, uploaded, timeout):
+    task = asyncio.create_task(gateway.uploader(spool, stats))
+    try:
+        deadline = asyncio.get_running_loop().time() + timeout
+        while stats['uploaded'] < uploaded and asyncio.get_running_loop().time() < deadline:
+            await asyncio.sleep(0.01)
+    finally:
+        task.cancel()
+
+
+def test_backoff_ends_as_soon_as_the_known_server_answers(gateway, tmp_path, monkeypatch):
+    spool = gateway.SampleSpool(str(tmp_path))
+    spool.append({"client_id": "pi-lab", "timestamp": 1_800_000_000})
+    probes = []
+    monkeypatch.setattr(gateway, 'UPLOAD_BACKOFF_INITIAL', 30)
+    monkeypatch.setattr(gateway, 'KNOWN_SERVER_PROBE_INTERVAL', 0.01)
+    monkeypatch.setattr(gateway, 'WIRE_FORMAT', 'json')
+    monkeypatch.setattr(gateway, 'find_server', lambda: ('192.0.2.1', 5000))
+    monkeypatch.setattr(gateway, 'load_known_server', lambda: {"host": '192.0.2.1', "port": 5000})
+    monkeypatch.setattr(gateway, 'probe_known_server', lambda known: probes.append(known) or ('restarted' if len(probes) > 2 else None))
+    monkeypatch.setattr(gateway.requests, 'Session', FakeSession)
+
+    stats = defaultdict(int)
+    asyncio.run(_upload_until(gateway, spool, stats, uploaded=1, timeout=5))
+    assert stats['uploaded'] == 1
+    assert stats['upload_failures'] == 1
+    assert len(probes) == 3
+    assert spool.read_batch(100)[0] == []
+
+
+def test_batch_spanning_a_clock_jump_is_split_at_the_jump(gateway, tmp_path, monkeypatch):
+    spool = gateway.SampleSpool(str(tmp_path))
+    # Sampled before NTP set the clock, then after: months apart in one spool.
+    spool.append_many([{"client_id": "pi-lab", "timestamp": timestamp, "gpio_statuses": [1]}
+                       for timestamp in (100.0, 100.1, 1_800_000_000.0, 1_800_000_000.1)])
+    session = RecordingSession()
+    monkeypatch.setattr(gateway, 'WIRE_FORMAT', 'binary')
+    monkeypatch.setattr(gateway, 'find_server', lambda: ('192.0.2.1', 5000))
+    monkeypatch.setattr(gateway.requests, 'Session', lambda: session)
+
+    stats = defaultdict(int)
+    asyncio.run(_upload_until(gateway, spool, stats, uploaded=4, timeout=5))
+    assert stats['uploaded'] == 4
+    assert len(session.bodies) == 2
+    assert all(isinstance(body, bytes) for body in session.bodies)
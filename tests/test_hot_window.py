@@ -0,0 +1,120 @@
+import datetime
+import json
+
+from sqlalchemy import event, insert
+
+
+def _seed(server, now):
+    rows = []
+    for index in range(200):    # 'busy': one sample every 3 s for 10 minutes
+        rows.append({"client_id": "busy", "created_at": now - datetime.timedelta(seconds=600 - 3 * index),
+                     "temp0": 20 + index % 8 * 0.25, "gpio1": index % 2})
+    for index in range(20):     # 'quiet': one sample every 30 s
+        rows.append({"client_id": "quiet", "created_at": now - datetime.timedelta(seconds=600 - 30 * index),
+                     "temp0": 18.5, "hum2": 40 + index * 0.5})
+    with server.app.app_context():
+        server.db.session.execute(insert(server.Readings), rows)
+        server.db.session.commit()
+
+
+def _hot_window(server, capacity):
+    window = server.HotWindow(capacity=capacity)
+    with server.app.app_context():
+        window.seed_from_database()
+    return window
+
+
+def _statements(server):
+    statements = []
+    with server.app.app_context():
+        event.listen(server.db.engine, 'before_cursor_execute', lambda conn, cursor, statement, *args: statements.append(statement))
+    return statements
+
+
+def test_window_held_by_every_ring_needs_no_query(server):
+    now = datetime.datetime.now(datetime.timezone.utc)
+    _seed(server, now)
+    window = _hot_window(server, capacity=1000)
+    statements = _statements(server)
+    start, end = now - datetime.timedelta(minutes=5), now
+    with server.app.app_context():
+        payload = window.graph_data(start, end)
+        assert statements == []
+        assert json.loads(payload) == json.loads(server.raw_graph_data(start, end))
+
+
+def test_only_clients_that_evicted_part_of_the_window_are_queried(server):
+    now = datetime.datetime.now(datetime.timezone.utc)
+    _seed(server, now)
+    window = _hot_window(server, capacity=50)
+    assert window.rings['busy'].evicted_until > server._epoch_ns(now - datetime.timedelta(minutes=5))
+    assert window.rings['quiet'].count == 20
+
+    statements = _statements(server)
+    start, end = now - datetime.timedelta(minutes=5), now
+    with server.app.app_context():
+        payload = window.graph_data(start, end)
+        assert len(statements) == 1 and 'client_id IN' in statements[0]
+        expected = json.loads(server.raw_graph_data(start, end))
+    assert list(json.loads(payload)) == list(expected)
+    assert json.loads(payload) == expected
+
+
+def test_window_older_than_the_prefill_is_not_covered(server):
+    now = datetime.datetime.now(datetime.timezone.utc)
+    _seed(server, now)
+    window = _hot_window(server, capacity=1000)
+    with server.app.app_context():
+        assert window.graph_data(now - datetime.timedelta(hours=2), now) is None
+
+
+def test_clients_over_the_point_budget_are_bucketed(server):
+    now = datetime.datetime.now(datetime.timezone.utc)
+    _seed(server, now)
+    window = _hot_window(server, capacity=1000)
+    start, end = now - datetime.timedelta(minutes=5), now
+    with server.app.app_context():
+        hot = json.loads(window.graph_data(start, end, max_points=30))
+        raw = json.loads(server.raw_graph_data(start, end, max_points=30))
+    assert hot == raw
+
+    busy, quiet = hot['busy'], hot['quiet']
+    assert 'resolution' not in quiet and len(quiet['timestamps']) == 10
+    # 100 samples 3 s apart into 10 s buckets: mean, min and max per bucket, GPIO as duty cycle.
+    assert busy['resolution'] == 10.0
+    assert len(busy['timestamps']) <= 31
+    temps = [20 + index % 8 * 0.25 for index in range(200)]
+    times = [now - datetime.timedelta(seconds=600 - 3 * index) for index in range(200)]
+    buckets = {}
+    for when, value in zip(times, temps):
+        if start <= when <= end:
+            buckets.setdefault(int(when.timestamp()) // 10, []).append(value)
+    expected = [buckets[key] for key in sorted(buckets)]
+    [sensor] = busy['i2c_data']
+    assert busy['i2c_data'][sensor] == [round(sum(values) / len(values), 4) for values in expected]
+    assert busy['i2c_min'][sensor] == [min(values) for values in expected]
+    assert busy['i2c_max'][sensor] == [max(values) for values in expected]
+    assert all(0 <= value <= 1 for value in next(iter(busy['gpio_data'].values())))
+
+
+def _iso_ms(timestamp):
+    return timestamp.astimezone(datetime.timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.') + f"{timestamp.microsecond // 1000:03d}Z"
+
+
+def test_timestamps_are_the_stored_created_at(server):
+    now = datetime.datetime.now(datetime.timezone.utc).replace(microsecond=250000)
+    _seed(server, now)
+    window = _hot_window(server, capacity=1000)
+    start, end = now - datetime.timedelta(minutes=5), now
+    expected = [_iso_ms(now - datetime.timedelta(seconds=600 - 30 * index)) for index in range(20)
+                if now - datetime.timedelta(seconds=600 - 30 * index) >= start]
+    with server.app.app_context():
+        hot = json.loads(window.graph_data(start, end))
+        raw = json.loads(server.raw_graph_data(start, end))
+        bucketed = json.loads(server.raw_graph_data(start, end, max_points=30))
+    assert hot['quiet']['timestamps'] == expected
+    assert raw['quiet']['timestamps'] == expected
+    # Buckets start on 10 s boundaries inside the window.
+    first_bucket = datetime.datetime.fromisoformat(bucketed['busy']['timestamps'][0].replace('Z', '+00:00'))
+    assert first_bucket.timestamp() % 10 == 0
+    assert start - datetime.timedelta(seconds=10) < first_bucket <= start + datetime.timedelta(seconds=10)
@@ -0,0 +1,134 @@
+import pytest
+from sqlalchemy.exc import OperationalError
+
+
+def _reading(client_id='pi-lab', **values):
+    return dict({"client_id": client_id, "created_at": "2026-10-16T12:00:00Z", "temp0": 21.5}, **values)
+
+
+def _count(server):
+    with server.app.app_context():
+        return server.Readings.query.count()
+
+
+def test_update_answers_after_the_rows_are_committed(server):
+    response = server.app.test_client().post('/update', json=[_reading(), _reading(temp0=22.0)])
+    assert response.status_code == 200
+    assert response.get_json() == {"accepted": 2, "rejected": []}
+    assert _count(server) == 2
+    assert server.ingest_buffer.pending_rows == 0
+
+
+def test_empty_batch_is_answered_without_a_write(server):
+    client = server.app.test_client()
+    empty_binary = b'IT' + bytes([server.TELEMETRY_SCHEMA_ID, 6]) + b'pi-lab' + server.TELEMETRY_HEADER.pack(1_800_000_000_000, 0, 0, 0)
+    for response in (client.post('/update', json=[]),
+                     client.post('/update', data=empty_binary, content_type=server.TELEMETRY_MIMETYPE)):
+        assert response.status_code == 200
+        assert response.get_json() == {"accepted": 0, "rejected": []}
+    ticket = server.ingest_buffer.add([])
+    with server.app.app_context():
+        assert server.ingest_buffer.flush() == 0
+    assert ticket.done.is_set() and ticket.error is None
+    assert server.ingest_buffer.stats['failed_batches'] == 0
+
+
+def test_rows_the_database_refuses_are_isolated_and_dropped(server):
+    rows = [{"client_id": f"pi-{index}", "temp0": float(index)} for index in range(7)]
+    rows[4]['client_id'] = None    # NOT NULL violation
+    ticket = server.ingest_buffer.add(rows)
+    with server.app.app_context():
+        assert server.ingest_buffer.flush() == 6
+    assert ticket.done.is_set() and ticket.error is None
+    assert ticket.rejected == [4]
+    assert _count(server) == 6
+    assert server.ingest_buffer.stats['rejected_rows'] == 1
+
+
+def test_failed_write_is_not_acknowledged_or_requeued(server, monkeypatch):
+    def unavailable(*args, **kwargs):
+        raise OperationalError("INSERT", {}, Exception("server closed the connection"))
+    monkeypatch.setattr(server.db.session, 'execute', unavailable)
+
+    response = server.app.test_client().post('/update', json=_reading())
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '1'
+    assert server.ingest_buffer.pending_rows == 0
+    assert server.ingest_buffer.stats['failed_batches'] == 1
+
+
+def test_failure_partway_through_isolating_bad_rows_stores_nothing(server, monkeypatch):
+    rows = [{"client_id": f"pi-{index}", "temp0": float(index)} for index in range(7)]
+    rows[4]['client_id'] = None    # NOT NULL violation, so the batch is split in halves
+    execute = server.db.session.execute
+    calls = []
+    def fail_on_second_half(statement, *args, **kwargs):
+        calls.append(statement)
+        if len(calls) == 3:
+            raise OperationalError("INSERT", {}, Exception("server closed the connection"))
+        return execute(statement, *args, **kwargs)
+    monkeypatch.setattr(server.db.session, 'execute', fail_on_second_half)
+
+    ticket = server.ingest_buffer.add(rows)
+    with server.app.app_context(), pytest.raises(OperationalError):
+        server.ingest_buffer.flush()
+    assert isinstance(ticket.error, OperationalError)
+    monkeypatch.undo()
+    assert _count(server) == 0
+
+
+def test_full_buffer_answers_503(server, monkeypatch):
+    monkeypatch.setattr(server, 'INGEST_MAX_PENDING', 1)
+    response = server.app.test_client().post('/update', json=[_reading(), _reading()])
+    assert response.status_code == 503
+    assert _count(server) == 0
+
+
+@pytest.mark.parametrize('body, index, message', [
+    ([_reading(), _reading(created_at=1e308)], 1, 'Timestamp out of range'),
+    ('[{"client_id": "pi-lab", "timestamp": Infinity}]', 0, 'Timestamp out of range'),
+    ('[{"client_id": "pi-lab", "timestamp": NaN}]', 0, 'Timestamp out of range'),
+    ([_reading(created_at='yesterday')], 0, 'Invalid isoformat'),
+    ('[{"client_id": "pi-lab", "temp0": NaN}]', 0, "'temp0' must be a finite number"),
+    ('[{"client_id": "pi-lab", "temps": [20.0, -Infinity]}]', 0, "'temps[1]' must be a finite number"),
+    ([_reading(), _reading(hum3=10 ** 400)], 1, "'hum3' must be a finite number"),
+    ([_reading(temp0='21.5')], 0, "'temp0' must be a number"),
+    ([_reading(gpio2=2)], 0, "'gpio2' must be 0, 1 or null"),
+    ([_reading(gpio2=True)], 0, "'gpio2' must be 0, 1 or null"),
+    ([_reading(gpio2=1.0)], 0, "'gpio2' must be 0, 1 or null"),
+    ('[{"client_id": "pi-lab", "gpio": [0, false]}]', 0, "'gpio[1]' must be 0, 1 or null"),
+    ([_reading(client_id='')], 0, "'client_id' must be a non-empty string"),
+    ([_reading(), {"client_id": "pi-lab", "temps": 5}], 1, "'temps' must be a list"),
+    ([{"client_id": "pi-lab", "gpio": "x"}], 0, "'gpio' must be a list"),
+    ([{"client_id": "pi-lab", "humd": {"0": 40}}], 0, "'humd' must be a list"),
+    ([{"client_id": "pi-lab", "i2c_devices": 5}], 0, "'i2c_devices' must be a list"),
+    ([{"client_id": "pi-lab", "i2c_devices": [21.5]}], 0, "'i2c_devices' entries must be JSON objects"),
+    ([{"client_id": "pi-lab", "gpio_statuses": "1010"}], 0, "'gpio_statuses' must be a list"),
+    ([_reading(), 'not an object'], 1, 'must be a JSON object'),
+])
+def test_update_rejects_invalid_samples_with_their_index(server, body, index, message):
+    client = server.app.test_client()
+    if isinstance(body, str):
+        response = client.post('/update', data=body, content_type='application/json')
+    else:
+        response = client.post('/update', json=body)
+    assert response.status_code == 400
+    assert response.get_json()['index'] == index
+    assert message in response.get_json()['error']
+    assert _count(server) == 0
+
+
+def test_gateway_devices_need_an_integer_channel(server):
+    reading = server.normalize_reading({"client_id": "pi-lab", "i2c_devices": [
+        {"channel": True, "temperature": 30.0}, {"channel": 2.0, "temperature": 31.0},
+        {"channel": 5, "temperature": 21.5}]}, None)
+    assert [reading[f'temp{index}'] for index in range(8)] == [None] * 5 + [21.5, None, None]
+
+
+def test_update_rejects_unparseable_json_and_other_content_types(server):
+    client = server.app.test_client()
+    response = client.post('/update', data='{"client_id": ', content_type='application/json')
+    assert response.status_code == 400
+    response = client.post('/update', data='client_id=pi-lab', content_type='application/x-www-form-urlencoded')
+    assert response.status_code == 415
+    assert 'application/json' in response.headers['Accept-Post']
@@ -0,0 +1,37 @@
+import datetime
+
+from sqlalchemy import insert
+
+
+def _insert(server, client_id, count):
+    now = datetime.datetime.now(datetime.timezone.utc)
+    rows = [{"client_id": client_id, "created_at": now, "temp0": 21.0} for _ in range(count)]
+    with server.app.app_context():
+        server.db.session.execute(insert(server.Readings), rows)
+        server.db.session.commit()
+
+
+def test_readings_replayed_after_a_restart_are_not_counted_again(server):
+    _insert(server, 'pi-lab', 5)    # written before the server started; no alarm checkpoint yet
+    with server.app.app_context():
+        server.live_state.seed_from_database()
+        assert server.live_state.last_reading_id == 0
+        server.live_state.catch_up()
+    assert server.metrics.client_readings == {}
+
+    _insert(server, 'pi-lab', 2)
+    with server.app.app_context():
+        server.live_state.catch_up()
+    assert server.metrics.client_readings == {'pi-lab': 2}
+    assert server.live_state.last_reading_id == 7
+
+
+def test_admin_dashboard_shows_the_live_state(server):
+    _insert(server, 'pi-lab', 3)
+    client = server.app.test_client()
+    with client.session_transaction() as session:
+        session['logged_in'] = True
+    response = client.get('/admin/dashboard')
+    assert response.status_code == 200
+    assert b'Client: pi-lab' in response.data
+    assert b'Last Update:</strong> N/A' not in response.data
@@ -0,0 +1,66 @@
+import datetime
+
+from sqlalchemy import text
+
+
+def _enable_partitioning(server, **settings):
+    server.app_config['readings_partitioning'] = dict(server.PARTITIONING_DEFAULTS, enabled=True, **settings)
+
+
+def _add_reading(server, created_at, client_id='pi-lab'):
+    with server.app.app_context():
+        server.db.session.add(server.Readings(client_id=client_id, created_at=created_at, temp0=21.5))
+        server.db.session.commit()
+
+
+def _relkind(server):
+    with server.app.app_context(), server.db.engine.connect() as connection:
+        return connection.execute(text("SELECT relkind FROM pg_class WHERE oid = to_regclass('readings')")).scalar()
+
+
+def test_partitioning_is_off_by_default(postgres_server):
+    assert postgres_server.partitioning_settings()['enabled'] is False
+    assert _relkind(postgres_server) == 'r'
+
+
+def test_maintenance_never_converts(postgres_server):
+    _enable_partitioning(postgres_server)
+    with postgres_server.app.app_context():
+        postgres_server.maintain_readings_partitions()
+    assert _relkind(postgres_server) == 'r'
+
+
+def test_migration_command_refuses_when_disabled(postgres_server):
+    result = postgres_server.app.test_cli_runner().invoke(args=['partition-readings'])
+    assert result.exit_code != 0
+    assert _relkind(postgres_server) == 'r'
+
+
+def test_new_partition_takes_rows_from_default(postgres_server):
+    server = postgres_server
+    now = datetime.datetime.now(datetime.timezone.utc)
+    _add_reading(server, now - datetime.timedelta(days=10))
+    _enable_partitioning(server, precreate_partitions=1)
+    result = server.app.test_cli_runner().invoke(args=['partition-readings'])
+    assert result.exit_code == 0, result.output
+    assert _relkind(server) == 'p'
+
+    # Lose the upcoming partition, as when the server was down for longer
+    # than precreate_partitions, so its rows land in DEFAULT.
+    tomorrow = server._partition_start(now, 1) + datetime.timedelta(days=1)
+    name = f"readings_p{tomorrow:%Y%m%d}"
+    with server.app.app_context(), server.db.engine.begin() as connection:
+        connection.execute(text(f"ALTER TABLE readings DETACH PARTITION {name}"))
+        connection.execute(text(f"DROP TABLE {name}"))
+    _add_reading(server, tomorrow + datetime.timedelta(hours=3))
+    _add_reading(server, tomorrow + datetime.timedelta(hours=4))
+    with server.app.app_context(), server.db.engine.connect() as connection:
+        assert connection.execute(text("SELECT count(*) FROM readings_default")).scalar() == 2
+
+    with server.app.app_context():
+        server.maintain_readings_partitions()
+        with server.db.engine.connect() as connection:
+            assert connection.execute(text("SELECT count(*) FROM readings_default")).scalar() == 0
+            assert connection.execute(text(f"SELECT count(*) FROM {name}")).scalar() == 2
+            assert connection.execute(text("SELECT count(*) FROM readings")).scalar() == 3
+            assert name in {partition for partition, _, _ in server.list_readings_partitions(connection)}
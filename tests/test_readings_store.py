@@ -0,0 +1,157 @@
+import datetime
+import json
+import os
+import warnings
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import insert, select
+
+
+def _seed(server, start, count, first=0):
+    rows = []
+    for index in range(first, first + count):    # one minute apart; both clients cross a UTC midnight
+        created_at = start + datetime.timedelta(minutes=index)
+        rows.append({"client_id": "pi-lab", "created_at": created_at, "temp0": round(20 + index % 10 * 0.1, 1),
+                     "gpio0": index % 2, "gpio3": None if index % 3 else 1})
+        rows.append({"client_id": "esp/32", "created_at": created_at, "temp1": round(18 + index % 7 * 0.3, 1),
+                     "hum1": 40.5 if index >= 30 else None})
+    with server.app.app_context():
+        server.db.session.execute(insert(server.Readings), rows)
+        server.db.session.commit()
+
+
+def _store(server, tmp_path, monkeypatch):
+    monkeypatch.setattr(server, 'SEGMENT_ARCHIVE_CHUNK_SIZE', 25)
+    monkeypatch.setattr(server, 'SEGMENT_INDEX_STRIDE', 8)
+    return server.SegmentReadingsStore(str(tmp_path / 'segments'))
+
+
+def _archive_all(server, store):
+    with server.app.app_context():
+        while store.archive_chunk():
+            pass
+
+
+def _frames(server, store, start, end):
+    with server.app.app_context():
+        expected = server.DatabaseReadingsStore().frame(start, end)
+        actual = store.frame(start, end)
+    # Channels nobody reported in the database part come back as None rather than NaN.
+    columns = server.READING_VALUE_COLUMNS
+    expected[columns] = expected[columns].astype(float)
+    actual[columns] = actual[columns].astype(float)
+    return expected, actual
+
+
+def _assert_same_frame(server, store, start, end):
+    expected, actual = _frames(server, store, start, end)
+    assert len(actual) == len(expected)
+    pd.testing.assert_frame_equal(actual, expected, check_dtype=False, rtol=1e-6)
+
+
+def _midnight():
+    today = datetime.datetime.now(datetime.timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+    return today - datetime.timedelta(days=1)
+
+
+def test_frame_from_segments_matches_the_database(server, tmp_path, monkeypatch):
+    start = _midnight() - datetime.timedelta(minutes=40)
+    _seed(server, start, 80)
+    store = _store(server, tmp_path, monkeypatch)
+    _archive_all(server, store)
+    _seed(server, start, 10, first=80)    # not archived yet: served from the database
+    assert store.archived_id == 160
+    assert sorted(os.listdir(tmp_path / 'segments')) == [start.strftime('%Y-%m-%d'), _midnight().strftime('%Y-%m-%d'), 'manifest.json']
+
+    _assert_same_frame(server, store, start, start + datetime.timedelta(hours=2))
+    _assert_same_frame(server, store, start + datetime.timedelta(minutes=33), start + datetime.timedelta(minutes=57))
+    with server.app.app_context():
+        only_esp = store.frame(start, start + datetime.timedelta(hours=2), client_ids=['esp/32'], after_id=100, columns=['hum1'])
+    assert set(only_esp['client_id']) == {'esp/32'}
+    assert len(only_esp) == 40 and only_esp['hum1'].eq(40.5).sum() == 40
+
+
+def test_export_from_segments_matches_the_database(server, tmp_path, monkeypatch):
+    start = _midnight() - datetime.timedelta(minutes=40)
+    _seed(server, start, 80)
+    store = _store(server, tmp_path, monkeypatch)
+    _archive_all(server, store)
+    _seed(server, start, 10, first=80)
+
+    query = select(*server.EXPORT_COLUMNS['readings'][0]).order_by(server.Readings.id.asc())
+    with server.app.app_context(), warnings.catch_warnings():
+        warnings.simplefilter('error')
+        expected = [row for chunk in server._export_chunks(query) for row in chunk]
+        actual = [row for chunk in store.export_chunks(query) for row in chunk]
+    assert len(actual) == len(expected) == 180
+    for exported, stored in zip(sorted(actual), expected):
+        assert exported[:2] == tuple(stored[:2])
+        assert server._as_utc(exported[2]) == server._as_utc(stored[2])
+        assert exported[3:] == tuple(stored[3:])
+
+
+def test_interrupted_append_is_cut_back_on_open(server, tmp_path, monkeypatch):
+    start = _midnight() - datetime.timedelta(minutes=40)
+    _seed(server, start, 40)
+    store = _store(server, tmp_path, monkeypatch)
+    _archive_all(server, store)
+    _seed(server, start, 40, first=40)
+
+    # A run that recorded its segments and wrote part of the append, then stopped before moving archived_id.
+    day = start.strftime('%Y-%m-%d')
+    store._write_manifest([[day, 'pi-lab']])
+    segment = server.ReadingSegment(store._path(day, 'pi-lab'))
+    values = np.full((3, len(server.READING_VALUE_COLUMNS)), np.nan)
+    segment.append(np.array([81, 83, 85]), np.full(3, segment.ids(segment.count)[-1] + 1), values)
+    with open(os.path.join(segment.path, 'temp0.f4'), 'ab') as f:
+        f.write(b'\0\0')
+
+    reopened = server.SegmentReadingsStore(store.root)
+    with server.app.app_context():
+        reopened.open()
+    assert server.ReadingSegment(segment.path).count == segment.count - 3
+    with open(reopened.manifest_path) as f:
+        assert json.load(f) == {"archived_id": 80, "pending": []}
+
+    _archive_all(server, reopened)
+    assert reopened.archived_id == 160
+    _assert_same_frame(server, reopened, start, start + datetime.timedelta(hours=2))
+
+
+def test_prune_keeps_rows_a_worker_has_not_consumed(server, tmp_path, monkeypatch):
+    start = _midnight() - datetime.timedelta(minutes=40)
+    _seed(server, start, 80)
+    store = _store(server, tmp_path, monkeypatch)
+    _archive_all(server, store)
+    _seed(server, datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(minutes=5), 5, first=80)
+    window = (start, start + datetime.timedelta(hours=2))
+    with server.app.app_context():
+        expected = store.frame(*window)
+
+    monkeypatch.setattr(server.live_state, 'last_reading_id', 100)
+    with server.app.app_context():
+        assert store.prune_database(retention_hours=1) == 100
+        assert server.db.session.execute(select(server.Readings.id).order_by(server.Readings.id)).scalars().first() == 101
+
+    monkeypatch.setattr(server.live_state, 'last_reading_id', 170)
+    with server.app.app_context():
+        assert store.prune_database(retention_hours=1) == 60
+        remaining = server.db.session.execute(select(server.Readings.created_at)).scalars().all()
+        assert len(remaining) == 10
+        pd.testing.assert_frame_equal(store.frame(*window), expected)
+
+
+def test_prune_keeps_the_newest_reading_of_a_quiet_client(server, tmp_path, monkeypatch):
+    _seed(server, _midnight(), 30)
+    store = _store(server, tmp_path, monkeypatch)
+    _archive_all(server, store)
+    monkeypatch.setattr(server.live_state, 'last_reading_id', 60)
+    with server.app.app_context():
+        assert store.prune_database(retention_hours=1) == 58
+        assert server.db.session.execute(select(server.Readings.id).order_by(server.Readings.id)).scalars().all() == [59, 60]
+
+        live_state = server.LiveStateStore()
+        live_state.seed_from_database()
+    assert live_state.latest('pi-lab')['temps'][0] == 20.9
+    assert live_state.latest('esp/32')['temps'][1] == 18.3
@@ -0,0 +1,78 @@
+import datetime
+
+import pytest
+from sqlalchemy import insert, select
+from sqlalchemy.exc import OperationalError
+
+START = datetime.datetime(2026, 10, 16, 12, 0, tzinfo=datetime.timezone.utc)
+VALUE_COLUMNS = ['sample_count', 'value_sum', 'value_min', 'value_max']
+
+
+def _insert(server, count, first=0):
+    rows = [{"client_id": f"pi-{index % 2}", "created_at": START + datetime.timedelta(seconds=7 * index),
+             "temp0": 20 + index % 5, "gpio1": index % 2} for index in range(first, first + count)]
+    with server.app.app_context():
+        server.db.session.execute(insert(server.Readings), rows)
+        server.db.session.commit()
+
+
+def _run(server):
+    with server.app.app_context():
+        if not server.db.session.get(server.RollupProcessorState, 1):
+            server.db.session.add(server.RollupProcessorState(id=1, last_processed_reading_id=0))
+            server.db.session.commit()
+        state = server.db.session.get(server.RollupProcessorState, 1)
+        while server.process_rollup_chunk(state):
+            pass
+        return state.last_processed_reading_id
+
+
+def _rollups(server):
+    columns = [getattr(server.ReadingRollups, name) for name in server.ROLLUP_KEY_COLUMNS + VALUE_COLUMNS]
+    with server.app.app_context():
+        rows = server.db.session.execute(select(*columns)).all()
+    return sorted((resolution, client_id, server._as_utc(bucket_start), *rest) for resolution, client_id, bucket_start, *rest in rows)
+
+
+def _expected(server):
+    with server.app.app_context():
+        frame = server.read_sql_frame(select(*server.ROLLUP_SOURCE_COLUMNS), ['id', 'client_id', 'created_at'] + server.READING_VALUE_COLUMNS)
+    rollups = server.aggregate_rollups(frame)
+    rollups['bucket_start'] = rollups['bucket_start'].dt.to_pydatetime()
+    return sorted(rollups[server.ROLLUP_KEY_COLUMNS + VALUE_COLUMNS].itertuples(index=False, name=None))
+
+
+def test_rerun_after_the_checkpoint_changes_nothing(server, monkeypatch):
+    monkeypatch.setattr(server, 'ROLLUP_CHUNK_SIZE', 40)
+    _insert(server, 100)
+    assert _run(server) == 100
+    folded = _rollups(server)
+    assert folded == _expected(server)
+
+    assert _run(server) == 100
+    assert _rollups(server) == folded
+
+
+def test_chunk_rolled_back_before_its_checkpoint_is_folded_once(server, monkeypatch):
+    _insert(server, 60)
+    _run(server)
+    _insert(server, 30, first=60)
+
+    def lost_connection():
+        raise OperationalError("COMMIT", {}, Exception("server closed the connection"))
+    with monkeypatch.context() as patch:
+        patch.setattr(server.db.session, 'commit', lost_connection)
+        with pytest.raises(OperationalError):
+            _run(server)
+    with server.app.app_context():
+        server.db.session.rollback()
+
+    assert _run(server) == 90
+    assert _rollups(server) == _expected(server)
+
+
+@pytest.mark.parametrize('query', [{'start': 'yesterday'}, {'end': '2026-13-01T00:00'}, {'timestamp': 'now'}])
+def test_graph_data_rejects_unparseable_times(server, query):
+    response = server.app.test_client().get('/graph_data', query_string=query)
+    assert response.status_code == 400
+    assert 'error' in response.get_json()
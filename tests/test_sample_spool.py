@@ -0,0 +1,71 @@
+import os
+
+
+def _samples(start, count):
+    return [{"client_id": "pi-lab", "timestamp": 1_800_000_000 + index, "n": index} for index in range(start, start + count)]
+
+
+def _numbers(samples):
+    return [sample['n'] for sample in samples]
+
+
+def test_batches_resume_from_the_committed_cursor_after_a_restart(gateway, tmp_path):
+    spool = gateway.SampleSpool(str(tmp_path))
+    spool.append_many(_samples(0, 10))
+    batch, position = spool.read_batch(4)
+    assert _numbers(batch) == [0, 1, 2, 3]
+    spool.commit(position)
+
+    restarted = gateway.SampleSpool(str(tmp_path))
+    batch, _ = restarted.read_batch(100)
+    assert _numbers(batch) == list(range(4, 10))
+
+
+def test_uncommitted_batch_is_sent_again_after_a_crash(gateway, tmp_path):
+    spool = gateway.SampleSpool(str(tmp_path))
+    spool.append_many(_samples(0, 5))
+    spool.commit(spool.read_batch(2)[1])
+    spool.read_batch(3)          # Sent, but the process dies before the server answers.
+    del spool
+
+    restarted = gateway.SampleSpool(str(tmp_path))
+    restarted.append_many(_samples(5, 2))
+    batch, position = restarted.read_batch(100)
+    assert _numbers(batch) == [2, 3, 4, 5, 6]
+    restarted.commit(position)
+    assert restarted.read_batch(100)[0] == []
+
+
+def test_line_cut_short_by_a_crash_is_skipped(gateway, tmp_path):
+    spool = gateway.SampleSpool(str(tmp_path))
+    spool.append_many(_samples(0, 3))
+    spool.writer.write(b'{"client_id": "pi-lab", "timest')
+    spool.writer.flush()
+    del spool
+
+    restarted = gateway.SampleSpool(str(tmp_path))
+    restarted.append_many(_samples(3, 2))
+    batch, position = restarted.read_batch(100)
+    assert _numbers(batch) == [0, 1, 2, 3, 4]
+    restarted.commit(position)
+    assert gateway.SampleSpool(str(tmp_path)).read_batch(100)[0] == []
+
+
+def test_commit_deletes_delivered_segments(gateway, tmp_path):
+    spool = gateway.SampleSpool(str(tmp_path), segment_bytes=200)
+    spool.append_many(_samples(0, 20))
+    assert len(spool.segments) > 3
+    batch, position = spool.read_batch(100)
+    assert _numbers(batch) == list(range(20))
+    spool.commit(position)
+    assert spool.segments == [position[0]]
+    assert sorted(name for name in os.listdir(tmp_path) if name.startswith('seg-')) == [f"seg-{position[0]:010d}.jsonl"]
+
+
+def test_reading_carries_on_after_the_size_cap_drops_the_cursor_segment(gateway, tmp_path):
+    spool = gateway.SampleSpool(str(tmp_path), segment_bytes=200, max_bytes=600)
+    spool.append_many(_samples(0, 40))
+    assert spool.evicted_segments > 0
+    batch, _ = spool.read_batch(100)
+    # The oldest samples are gone; what is left arrives in order, ending with the newest.
+    assert batch and _numbers(batch) == list(range(_numbers(batch)[0], 40))
@@ -0,0 +1,83 @@
+import datetime
+
+from sqlalchemy import insert
+
+START = datetime.datetime(2026, 10, 16, 12, 0, tzinfo=datetime.timezone.utc)
+
+
+def _seed(server):
+    rows = []
+    for index in range(120):    # 'pi-lab': one sample a minute for two hours
+        rows.append({"client_id": "pi-lab", "created_at": START + datetime.timedelta(minutes=index),
+                     "temp0": float(index % 10), "gpio1": int(index % 4 == 0)})
+    for index in range(30):     # 'esp-hall': humidity only, first half hour
+        rows.append({"client_id": "esp-hall", "created_at": START + datetime.timedelta(minutes=index), "hum2": 50.0})
+    with server.app.app_context():
+        server.db.session.execute(insert(server.Readings), rows)
+        server.db.session.add(server.RollupProcessorState(id=1, last_processed_reading_id=0))
+        server.db.session.commit()
+        state = server.db.session.get(server.RollupProcessorState, 1)
+        while server.process_rollup_chunk(state):
+            pass
+
+
+def _stats(server, start, end, **args):
+    query = dict(start=start.isoformat(), end=end.isoformat(), **args)
+    response = server.app.test_client().get('/stats', query_string=query)
+    assert response.status_code == 200
+    return response.get_json()
+
+
+def test_raw_statistics_per_hour(server):
+    _seed(server)
+    payload = _stats(server, START, START + datetime.timedelta(hours=2), channels='temp0,gpio1,hum2', threshold=7)
+    assert payload['source'] == 'readings' and payload['bucket_seconds'] == 3600
+    assert sorted(payload['clients']) == ['esp-hall', 'pi-lab']
+
+    temp0 = payload['clients']['pi-lab']['channels']['temp0']
+    assert temp0['bucket_start'] == ['2026-10-16T12:00:00.000Z', '2026-10-16T13:00:00.000Z']
+    assert temp0['count'] == [60, 60]
+    assert temp0['mean'] == [4.5, 4.5]
+    assert (temp0['min'], temp0['max'], temp0['p95']) == ([0, 0], [9, 9], [9, 9])
+    assert temp0['fraction_above'] == [0.2, 0.2]
+    assert payload['clients']['pi-lab']['channels']['gpio1']['duty_cycle'] == [0.25, 0.25]
+    assert set(payload['clients']['pi-lab']['channels']) == {'temp0', 'gpio1'}
+    assert payload['clients']['esp-hall']['channels']['hum2']['count'] == [30]
+
+
+def test_rollups_give_the_same_answer_as_raw_readings(server):
+    _seed(server)
+    # The first and last buckets are only partly inside the window and are filled from raw readings.
+    start, end = START + datetime.timedelta(minutes=25), START + datetime.timedelta(minutes=100)
+    rollups = _stats(server, start, end, channels='temp0,gpio1', stats='count,mean,min,max,duty_cycle')
+    readings = _stats(server, start, end, channels='temp0,gpio1', stats='count,mean,min,max,duty_cycle', threshold=100)
+    assert (rollups['source'], readings['source']) == ('rollups', 'readings')
+
+    channels = rollups['clients']['pi-lab']['channels']
+    assert channels['temp0']['count'] == [35, 40]
+    for channel, series in channels.items():
+        expected = dict(readings['clients']['pi-lab']['channels'][channel])
+        expected.pop('fraction_above', None)
+        assert series == expected
+
+
+def test_rollups_include_readings_not_yet_folded_in(server):
+    _seed(server)
+    late = [{"client_id": "pi-lab", "created_at": START + datetime.timedelta(minutes=90, seconds=30), "temp0": 50.0}]
+    with server.app.app_context():
+        server.db.session.execute(insert(server.Readings), late)
+        server.db.session.commit()
+
+    payload = _stats(server, START, START + datetime.timedelta(hours=2), channels='temp0', stats='count,max')
+    assert payload['source'] == 'rollups'
+    temp0 = payload['clients']['pi-lab']['channels']['temp0']
+    assert (temp0['count'], temp0['max']) == ([60, 61], [9, 50])
+
+
+def test_client_and_window_filters(server):
+    _seed(server)
+    payload = _stats(server, START + datetime.timedelta(hours=3), START + datetime.timedelta(hours=4))
+    assert payload['clients'] == {}
+    payload = _stats(server, START, START + datetime.timedelta(hours=2), clients='esp-hall', bucket=900)
+    assert list(payload['clients']) == ['esp-hall']
+    assert payload['clients']['esp-hall']['channels']['hum2']['count'] == [15, 15]
@@ -0,0 +1,89 @@
+import datetime
+import math
+
+import pytest
+
+
+def _sample(timestamp, devices, gpios, client_id='pi-lab'):
+    return {"client_id": client_id, "timestamp": timestamp, "i2c_devices": devices, "gpio_statuses": gpios}
+
+
+RECEIVED_AT = datetime.datetime(2026, 10, 17, 12, 0, tzinfo=datetime.timezone.utc)
+
+
+def _decoded(gateway, server, samples):
+    body = gateway.encode_telemetry_batch(samples)
+    return server.decode_telemetry_batch(body, RECEIVED_AT)
+
+
+def test_round_trip_keeps_values_times_and_null_channels(gateway, server):
+    samples = [
+        _sample(1_800_000_000.125, [{"channel": 0, "temperature": 21.5}, {"channel": 3, "temperature": -4.25, "humidity": 55.5}], [1, 0, None, 1]),
+        _sample(1_800_000_000.225, [{"channel": 3, "temperature": -4.0}], [0, 0, 1]),
+        _sample(1_800_000_001.0, [], []),
+    ]
+    rows = _decoded(gateway, server, samples)
+
+    assert [row['client_id'] for row in rows] == ['pi-lab'] * 3
+    assert [row['created_at'] for row in rows] == [
+        datetime.datetime.fromtimestamp(sample['timestamp'], datetime.timezone.utc) for sample in samples]
+    assert [row['temp0'] for row in rows] == [21.5, None, None]
+    assert [row['temp3'] for row in rows] == [-4.25, -4.0, None]
+    assert [row['hum3'] for row in rows] == [55.5, None, None]
+    # Channels no sample reported are not in the batch at all and come back as null.
+    assert all(row[f'temp{channel}'] is None for row in rows for channel in (1, 2, 4, 5, 6, 7))
+    assert all(row['hum0'] is None for row in rows)
+
+
+def test_round_trip_gpio_masks(gateway, server):
+    samples = [
+        _sample(1_800_000_000.0, [], [1, 0, None, 1, 0, 1, None, 1]),
+        _sample(1_800_000_000.1, [], [0, 1]),
+        _sample(1_800_000_000.2, [], [1, 1, 1, 1, 1, 1, 1, 1, 0]),   # gpio3 reports 9 pins; only 8 fit
+    ]
+    rows = _decoded(gateway, server, samples)
+    assert [[row[f'gpio{pin}'] for pin in range(8)] for row in rows] == [
+        [1, 0, None, 1, 0, 1, None, 1],
+        [0, 1, None, None, None, None, None, None],
+        [1, 1, 1, 1, 1, 1, 1, 1],
+    ]
+
+
+def test_direct_sensors_fill_the_first_free_channel_like_json(gateway, server):
+    sample = _sample(1_800_000_000.0, [{"channel": 0, "temperature": 20.0}, {"channel": None, "temperature": 22.0}], [])
+    [row] = _decoded(gateway, server, [sample])
+    json_row = server.normalize_reading(sample, None)
+    assert row['temp0'] == json_row['temp0'] == 20.0
+    assert row['temp1'] == json_row['temp1'] == 22.0
+
+
+@pytest.mark.parametrize('value', [327.68, -400.0, 1e9, math.inf, math.nan])
+def test_values_out_of_fixed_point_range_are_sent_as_null(gateway, server, value):
+    samples = [_sample(1_800_000_000.0, [{"channel": 0, "temperature": value}, {"channel": 1, "temperature": 327.67}], [])]
+    [row] = _decoded(gateway, server, samples)
+    assert row['temp0'] is None
+    assert row['temp1'] == 327.67
+
+
+def test_truncated_batch_is_refused(gateway, server):
+    body = gateway.encode_telemetry_batch([_sample(1_800_000_000.0, [{"channel": 0, "temperature": 20.0}], [1])])
+    with pytest.raises(ValueError):
+        server.decode_telemetry_batch(body[:-1], RECEIVED_AT)
+    response = server.app.test_client().post('/update', data=body[:-1], content_type=gateway.TELEMETRY_MIMETYPE)
+    assert response.status_code == 400
+
+
+def test_clock_jump_starts_a_new_batch(gateway, server):
+    months = 90 * 86400
+    samples = [_sample(1_800_000_000.0, [], [1]), _sample(1_800_000_000.5, [], [0]),
+               _sample(1_800_000_000.5 + months, [], [1]), _sample(1_800_000_001.0 + months, [], [0])]
+    assert gateway.telemetry_batch_span(samples) == 2
+    assert gateway.telemetry_batch_span(samples[2:]) == 2
+    rows = _decoded(gateway, server, samples[2:])
+    assert [row['gpio0'] for row in rows] == [1, 0]
+
+
+def test_times_from_an_unset_clock_become_the_receive_time(gateway, server):
+    samples = [_sample(86_400.0, [], [1]), _sample(86_400.5, [], [0])]
+    rows = _decoded(gateway, server, samples)
+    assert [row['created_at'] for row in rows] == [RECEIVED_AT, RECEIVED_AT]